@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
-from .models import UserProfiles, Teams, TicketTransaction
+from .models import UserProfiles, Teams, TicketTransaction, TicketBalance, TeamPoolDaily, UserDailyActivity
 
 
 @admin.register(Teams)
 class TeamsAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "is_open", "created_at", "updated_at")
+    list_display = ("id", "name", "is_open", "member_count", "created_at", "updated_at")
     list_filter = ("is_open",)
     search_fields = ("name",)
 
@@ -40,4 +40,29 @@ class UserProfilesAdmin(BaseUserAdmin):
 class TicketTransactionAdmin(admin.ModelAdmin):
     list_display = ("id", "owner_type", "user", "team", "source", "amount", "ref_type", "ref_id", "created_at")
     list_filter = ("owner_type", "source")
-    search_fields = ("ref_type", "ref_id")
\ No newline at end of file
+    search_fields = ("ref_type", "ref_id")
+    list_select_related = ("user", "team")
+    ordering = ("-created_at", "-id")
+    # 絞り込み前の全件 COUNT(*) をしない（台帳は行数が多い）
+    show_full_result_count = False
+
+
+@admin.register(TicketBalance)
+class TicketBalanceAdmin(admin.ModelAdmin):
+    list_display = ("id", "owner_type", "user", "team", "balance", "updated_at")
+    list_filter = ("owner_type",)
+    readonly_fields = ("owner_type", "user", "team", "balance", "updated_at")
+
+
+@admin.register(TeamPoolDaily)
+class TeamPoolDailyAdmin(admin.ModelAdmin):
+    list_display = ("id", "team", "day", "income", "outcome", "updated_at")
+    list_filter = ("day",)
+    readonly_fields = ("team", "day", "income", "outcome", "updated_at")
+
+
+@admin.register(UserDailyActivity)
+class UserDailyActivityAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "day", "reservations", "completions", "misses", "recoveries", "net_tickets", "updated_at")
+    list_filter = ("day",)
+    readonly_fields = ("user", "day", "reservations", "completions", "misses", "recoveries", "net_tickets", "updated_at")
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+from .models import UserProfiles
+from apps.common.cache import CacheNamespace
+
+
+# ログイン中のユーザーを毎リクエスト DB から読み直さないよう、チームと一緒にキャッシュに置く。
+# - ユーザー・チームを save / delete したら signals でキャッシュを捨てる
+# - QuerySet.update() など signals を通らない更新は、AUTH_USER_CACHE_TTL 秒たてば反映される
+#   （チームの member_count / is_open は .update() で変わるので、認証ユーザーの team のこれらの値は信用しない）
+
+
+user_cache = CacheNamespace("auth")
+
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def _user_cache_ttl():
+    return getattr(settings, "AUTH_USER_CACHE_TTL", 60)
+
+
+def _user_queryset():
+    return UserProfiles._default_manager.select_related("team")
+
+
+def invalidate_cached_users(user_ids):
+    user_cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend の get_user をキャッシュつきにしたもの（user.team も読み込み済みで返す）。"""
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = user_cache.get(key)
+        if user is None:
+            try:
+                user = _user_queryset().get(pk=user_id)
+            except UserProfiles.DoesNotExist:
+                return None
+            user_cache.set(key, user, _user_cache_ttl())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await user_cache.aget(key)
+        if user is None:
+            try:
+                user = await _user_queryset().aget(pk=user_id)
+            except UserProfiles.DoesNotExist:
+                return None
+            await user_cache.aset(key, user, _user_cache_ttl())
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, LPad, Lower
+from django.utils import timezone
+
+from apps.accounts.models import Teams, UserProfiles, TicketBalance, TicketTransaction, TicketSource, UserDailyActivity
+from apps.accounts.services import INITIAL_TICKETS, TEAM_SIZE
+
+
+def _init_worker():
+    # spawn で起動したワーカーでも make_password が settings を読めるように
+    django.setup()
+
+
+def _hash_password(password):
+    # パスワードなしの行はログイン不可（パスワードリセットで設定してもらう）
+    return make_password(password or None)
+
+
+class Command(BaseCommand):
+    help = (
+        "CSV（email,display_name,password）または JSONL からユーザーを一括登録する。"
+        "8人ずつ新しいチームに詰め、初期チケットも付与する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="省略時は拡張子から判定")
+        parser.add_argument("--chunk", type=int, default=2000, help="1トランザクションで登録する人数")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="パスワードハッシュのプロセス数")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = list(self._read(options["path"], options["format"]))
+        people, skipped = self._validate(rows)
+        self.stdout.write(f"read {len(rows)} row(s): {len(people)} to import, {len(skipped)} skipped")
+        for line_no, reason in skipped[:20]:
+            self.stdout.write(f"  line {line_no}: {reason}")
+        if options["dry_run"] or not people:
+            return
+
+        hash_started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+            hashes = list(pool.map(_hash_password, [p["password"] for p in people], chunksize=64))
+        hash_seconds = time.monotonic() - hash_started
+        self.stdout.write(f"hashed {len(hashes)} password(s) in {hash_seconds:.1f}s")
+
+        # チームの途中で区切らないよう、チャンクは8の倍数にする
+        chunk = max(TEAM_SIZE, options["chunk"] // TEAM_SIZE * TEAM_SIZE)
+        users = teams = 0
+        for start in range(0, len(people), chunk):
+            created_users, created_teams = self._import_chunk(
+                people[start:start + chunk], hashes[start:start + chunk],
+            )
+            users += created_users
+            teams += created_teams
+            self.stdout.write(f"imported {users}/{len(people)} user(s), {teams} team(s)")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"done in {elapsed:.1f}s: users={users} teams={teams} skipped={len(skipped)} "
+            f"rate={users / elapsed:.0f} users/s"
+        ))
+
+    # ---- input ----
+
+    def _read(self, path, fmt):
+        fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        with open(path, newline="", encoding="utf-8") as f:
+            if fmt == "csv":
+                for line_no, row in enumerate(csv.DictReader(f), start=2):
+                    yield line_no, row
+            else:
+                for line_no, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield line_no, json.loads(line)
+                    except json.JSONDecodeError as exc:
+                        raise CommandError(f"line {line_no}: {exc}")
+
+    def _validate(self, rows):
+        existing = set(UserProfiles.objects.annotate(e=Lower("email")).values_list("e", flat=True))
+        people, skipped = [], []
+        for line_no, row in rows:
+            email = UserProfiles.objects.normalize_email((row.get("email") or "").strip())
+            display_name = (row.get("display_name") or "").strip()
+            if not email or not display_name:
+                skipped.append((line_no, "missing email or display_name"))
+                continue
+            try:
+                validate_email(email)
+            except ValidationError:
+                skipped.append((line_no, f"invalid email {email!r}"))
+                continue
+            if email.lower() in existing:
+                skipped.append((line_no, f"{email} already exists"))
+                continue
+            existing.add(email.lower())
+            people.append({
+                "email": email,
+                "display_name": display_name[:50],
+                "password": row.get("password") or None,
+            })
+        return people, skipped
+
+    # ---- write ----
+
+    @transaction.atomic
+    def _import_chunk(self, people, hashes):
+        sizes = [min(TEAM_SIZE, len(people) - i) for i in range(0, len(people), TEAM_SIZE)]
+        teams = Teams.objects.bulk_create([
+            Teams(name="Team", member_count=size, is_open=size < TEAM_SIZE) for size in sizes
+        ])
+        # assign_team_for_user と同じ Team-0001 形式
+        Teams.objects.filter(id__in=[team.id for team in teams]).update(
+            name=Concat(Value("Team-"), LPad(Cast("id", CharField()), 4, Value("0"))),
+        )
+
+        users = UserProfiles.objects.bulk_create(
+            [
+                UserProfiles(
+                    email=person["email"],
+                    display_name=person["display_name"],
+                    password=password,
+                    team=teams[i // TEAM_SIZE],
+                )
+                for i, (person, password) in enumerate(zip(people, hashes))
+            ],
+            batch_size=1000,
+        )
+
+        TicketTransaction.objects.bulk_create(
+            [
+                TicketTransaction(
+                    owner_type=TicketTransaction.OwnerType.USER,
+                    user=user,
+                    source=TicketSource.INITIAL_GRANT,
+                    ref_type="initial_grant",
+                    ref_id=str(user.user_id),
+                    amount=INITIAL_TICKETS,
+                )
+                for user in users
+            ],
+            batch_size=1000,
+        )
+        TicketBalance.objects.bulk_create(
+            [
+                TicketBalance(
+                    owner_type=TicketTransaction.OwnerType.USER,
+                    user=user,
+                    balance=INITIAL_TICKETS,
+                )
+                for user in users
+            ],
+            batch_size=1000,
+        )
+        today = timezone.localdate()
+        UserDailyActivity.objects.bulk_create(
+            [UserDailyActivity(user=user, day=today, net_tickets=INITIAL_TICKETS) for user in users],
+            batch_size=1000,
+        )
+        return len(users), len(teams)
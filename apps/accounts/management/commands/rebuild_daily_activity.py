@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.services import find_daily_activity_mismatches, rebuild_daily_activity
+
+
+class Command(BaseCommand):
+    help = "予約と TicketTransaction の台帳から UserDailyActivity を作り直す（--check は検証のみ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="作り直さずに、集計テーブルと予約・台帳の差分だけを表示する",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = find_daily_activity_mismatches()
+            for user_id, day, actual, expected in mismatches:
+                self.stdout.write(f"USER {user_id} {day}: rollup={actual} source={expected}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} user day(s) out of sync")
+            self.stdout.write(self.style.SUCCESS("all user days match reservations and the ledger"))
+            return
+
+        days = rebuild_daily_activity()
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {days} user day(s)"))
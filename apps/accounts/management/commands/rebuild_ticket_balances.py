@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.services import (
+    find_balance_mismatches,
+    find_team_pool_daily_mismatches,
+    rebuild_team_pool_daily,
+    rebuild_ticket_balances,
+)
+
+
+class Command(BaseCommand):
+    help = "TicketTransaction の台帳から TicketBalance と TeamPoolDaily を作り直す（--check は検証のみ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="作り直さずに、スナップショットと台帳の差分だけを表示する",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = find_balance_mismatches()
+            for owner_type, owner_id, balance, expected in mismatches:
+                self.stdout.write(f"{owner_type} {owner_id}: snapshot={balance} ledger={expected}")
+            pool_mismatches = find_team_pool_daily_mismatches()
+            for team_id, day, actual, expected in pool_mismatches:
+                self.stdout.write(f"TEAM {team_id} {day}: rollup={actual} ledger={expected}")
+            if mismatches or pool_mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} balance(s) and {len(pool_mismatches)} pool day(s) out of sync"
+                )
+            self.stdout.write(self.style.SUCCESS("all balances and pool days match the ledger"))
+            return
+
+        users, teams = rebuild_ticket_balances()
+        days = rebuild_team_pool_daily()
+        self.stdout.write(self.style.SUCCESS(
+            f"rebuilt {users} user and {teams} team balance(s), {days} team pool day(s)"
+        ))
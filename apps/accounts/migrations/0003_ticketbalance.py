@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_tickettransaction_initial_grant_requires_ref'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tickettransaction',
+            name='source',
+            field=models.CharField(choices=[('INITIAL_GRANT', 'Initial grant'), ('RESERVATION_DEPOSIT', 'Reservation deposit'), ('DEPOSIT_RETURN', 'Deposit return'), ('ADMIN_BONUS', 'Admin bonus'), ('FAIL_TO_TEAM_POOL', 'Fail to team pool'), ('RECOVERY', 'Recovery')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='TicketBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.CharField(choices=[('USER', 'User'), ('TEAM', 'Team')], max_length=10)),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('team', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ticket_balance', to='accounts.teams')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ticket_balance', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('owner_type', 'USER'), ('user__isnull', False), ('team__isnull', True)), models.Q(('owner_type', 'TEAM'), ('team__isnull', False), ('user__isnull', True)), _connector='OR'), name='ticket_balance_owner_match')],
+            },
+        ),
+    ]
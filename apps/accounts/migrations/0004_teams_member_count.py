@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_member_count(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Teams = apps.get_model('accounts', 'Teams')
+    UserProfiles = apps.get_model('accounts', 'UserProfiles')
+    counts = (
+        UserProfiles.objects.filter(team=OuterRef('pk'))
+        .values('team')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    Teams.objects.using(db).update(member_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_ticketbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teams',
+            name='member_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_member_count, migrations.RunPython.noop),
+    ]
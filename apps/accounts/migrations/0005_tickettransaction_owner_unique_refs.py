@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_refs(apps, schema_editor):
+    # uniq_ticket_ref は NULL を含むため効いておらず、同一参照の重複行が残っている可能性がある。
+    # 最初の1行だけ残す（残高は rebuild_ticket_balances で作り直す）
+    TicketTransaction = apps.get_model('accounts', 'TicketTransaction')
+    duplicates = (
+        TicketTransaction.objects
+        .values('owner_type', 'user', 'team', 'source', 'ref_type', 'ref_id')
+        .annotate(first_id=Min('id'), n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        (
+            TicketTransaction.objects
+            .filter(
+                owner_type=row['owner_type'],
+                user=row['user'],
+                team=row['team'],
+                source=row['source'],
+                ref_type=row['ref_type'],
+                ref_id=row['ref_id'],
+            )
+            .exclude(id=row['first_id'])
+            .delete()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_teams_member_count'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='tickettransaction',
+            name='uniq_ticket_ref',
+        ),
+        migrations.RunPython(drop_duplicate_refs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tickettransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('owner_type', 'USER')), fields=('user', 'source', 'ref_type', 'ref_id'), name='uniq_user_ticket_ref'),
+        ),
+        migrations.AddConstraint(
+            model_name='tickettransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('owner_type', 'TEAM')), fields=('team', 'source', 'ref_type', 'ref_id'), name='uniq_team_ticket_ref'),
+        ),
+    ]
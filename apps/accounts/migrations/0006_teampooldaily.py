@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def backfill_team_pool_daily(apps, schema_editor):
+    db = schema_editor.connection.alias
+    TicketTransaction = apps.get_model('accounts', 'TicketTransaction')
+    TeamPoolDaily = apps.get_model('accounts', 'TeamPoolDaily')
+    rows = (
+        TicketTransaction.objects.using(db)
+        .filter(owner_type='TEAM')
+        .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .values('team_id', 'day')
+        .annotate(
+            income=Coalesce(Sum('amount', filter=Q(amount__gt=0)), 0),
+            outcome=Coalesce(-Sum('amount', filter=Q(amount__lt=0)), 0),
+        )
+    )
+    TeamPoolDaily.objects.using(db).bulk_create(
+        [
+            TeamPoolDaily(team_id=row['team_id'], day=row['day'], income=row['income'], outcome=row['outcome'])
+            for row in rows.iterator(chunk_size=2000)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_tickettransaction_owner_unique_refs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamPoolDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('income', models.PositiveIntegerField(default=0)),
+                ('outcome', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pool_days', to='accounts.teams')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('team', 'day'), name='uniq_team_pool_day')],
+            },
+        ),
+        migrations.RunPython(backfill_team_pool_daily, migrations.RunPython.noop),
+    ]
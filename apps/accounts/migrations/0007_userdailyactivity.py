@@ -0,0 +1,74 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_user_daily_activity(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Reservation = apps.get_model('reservations', 'Reservation')
+    TicketTransaction = apps.get_model('accounts', 'TicketTransaction')
+    UserDailyActivity = apps.get_model('accounts', 'UserDailyActivity')
+    tz = timezone.get_current_timezone()
+    completed = Q(status='completed') | Q(completed_at__isnull=False)
+    days = {}
+    rows = (
+        Reservation.objects.using(db)
+        .annotate(day=TruncDate('start_at', tzinfo=tz))
+        .values('user_id', 'day')
+        .annotate(
+            reservations=Count('id'),
+            completions=Count('id', filter=completed),
+            misses=Count('id', filter=Q(status='missed')),
+            recoveries=Count('id', filter=Q(status='recovery')),
+        )
+    )
+    for row in rows.iterator(chunk_size=2000):
+        key = (row.pop('user_id'), row.pop('day'))
+        days[key] = UserDailyActivity(**row)
+    tickets = (
+        TicketTransaction.objects.using(db)
+        .filter(owner_type='USER')
+        .annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('user_id', 'day')
+        .annotate(total=Sum('amount'))
+    )
+    for row in tickets.iterator(chunk_size=2000):
+        days.setdefault((row['user_id'], row['day']), UserDailyActivity()).net_tickets = row['total']
+    for (user_id, day), activity in days.items():
+        activity.user_id = user_id
+        activity.day = day
+    UserDailyActivity.objects.using(db).bulk_create(days.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_teampooldaily'),
+        ('reservations', '0002_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reservations', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+                ('recoveries', models.PositiveIntegerField(default=0)),
+                ('net_tickets', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='uniq_user_daily_activity')],
+            },
+        ),
+        migrations.RunPython(backfill_user_daily_activity, migrations.RunPython.noop),
+    ]
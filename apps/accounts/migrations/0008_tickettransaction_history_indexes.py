@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_userdailyactivity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tickettransaction',
+            index=models.Index(condition=models.Q(('owner_type', 'USER')), fields=['user', 'created_at', 'id'], name='ticket_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tickettransaction',
+            index=models.Index(condition=models.Q(('owner_type', 'TEAM')), fields=['team', 'created_at', 'id'], name='ticket_team_history_idx'),
+        ),
+    ]
@@ -8,6 +8,8 @@ class Teams(models.Model):
     name = models.CharField(max_length=50)
     # 自動割当のときに、is_open=True のチームだけから選び、8人に達したら False にする想定
     is_open = models.BooleanField(default=True) 
+    # 所属人数（assign_team_for_user が条件付き UPDATE で増やす）
+    member_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -116,8 +118,94 @@ class TicketTransaction(models.Model):
                 name="initial_grant_requires_ref",
             ),
             # 同一参照の二重書き込み防止
+            # user / team の片方は必ず NULL で、NULL 同士は重複扱いにならないため owner ごとに部分インデックスで張る
             models.UniqueConstraint(
-                fields=["owner_type", "user", "team", "source", "ref_type", "ref_id"],
-                name="uniq_ticket_ref",
+                fields=["user", "source", "ref_type", "ref_id"],
+                condition=models.Q(owner_type="USER"),
+                name="uniq_user_ticket_ref",
             ),
-        ]
\ No newline at end of file
+            models.UniqueConstraint(
+                fields=["team", "source", "ref_type", "ref_id"],
+                condition=models.Q(owner_type="TEAM"),
+                name="uniq_team_ticket_ref",
+            ),
+        ]
+        indexes = [
+            # 履歴（owner ごとに (created_at, id) の降順でカーソルページング）
+            models.Index(
+                fields=["user", "created_at", "id"],
+                condition=models.Q(owner_type="USER"),
+                name="ticket_user_history_idx",
+            ),
+            models.Index(
+                fields=["team", "created_at", "id"],
+                condition=models.Q(owner_type="TEAM"),
+                name="ticket_team_history_idx",
+            ),
+        ]
+
+
+# ==== 残高スナップショット（台帳の集計結果を保持） ====
+class TicketBalance(models.Model):
+    owner_type = models.CharField(max_length=10, choices=TicketTransaction.OwnerType.choices)
+
+    # 片方だけ必須（TicketTransaction と同じルール）
+    user = models.OneToOneField("accounts.UserProfiles", null=True, blank=True, on_delete=models.CASCADE, related_name="ticket_balance")
+    team = models.OneToOneField("accounts.Teams", null=True, blank=True, on_delete=models.CASCADE, related_name="ticket_balance")
+
+    # 台帳の SUM(amount) と常に一致させる
+    balance = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    (models.Q(owner_type="USER") & models.Q(user__isnull=False) & models.Q(team__isnull=True)) |
+                    (models.Q(owner_type="TEAM") & models.Q(team__isnull=False) & models.Q(user__isnull=True))
+                ),
+                name="ticket_balance_owner_match",
+            ),
+        ]
+
+
+# ==== チームプールの日次集計（タイムラインのヘッダー用） ====
+class TeamPoolDaily(models.Model):
+    team = models.ForeignKey("accounts.Teams", on_delete=models.CASCADE, related_name="pool_days")
+    # TIME_ZONE での日付
+    day = models.DateField()
+
+    # その日のチームプールへの流入（amount > 0 の合計）と支出（amount < 0 の絶対値の合計）
+    income = models.PositiveIntegerField(default=0)
+    outcome = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["team", "day"], name="uniq_team_pool_day"),
+        ]
+
+
+# ==== ユーザーの日次アクティビティ（マイページの統計用） ====
+class UserDailyActivity(models.Model):
+    user = models.ForeignKey("accounts.UserProfiles", on_delete=models.CASCADE, related_name="daily_activity")
+    # 予約の start_at（TIME_ZONE）の日付。net_tickets だけは台帳行の created_at の日付
+    day = models.DateField()
+
+    # その日に始まる予約の数と、そのうち現在のステータスごとの数
+    reservations = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    recoveries = models.PositiveIntegerField(default=0)
+
+    # その日のユーザーの台帳行の合計（増減）
+    net_tickets = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day"], name="uniq_user_daily_activity"),
+        ]
@@ -1,121 +1,604 @@
-from django.db import transaction
-from django.db.models import Count, Sum
-from .models import Teams, UserProfiles, TicketTransaction, TicketSource
+from datetime import timedelta
 
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Teams, UserProfiles, TicketTransaction, TicketSource, TicketBalance, TeamPoolDaily, UserDailyActivity
+from apps.reservations.models import Reservation
+from apps.common.cursors import keyset_page
+from apps.common.dates import local_day_range
+
+
+TEAM_SIZE = 8
+# 登録時に配るチケット
+INITIAL_TICKETS = 7
+# 取り合いに負けたときに、別の空きチームを探し直す回数
+TEAM_CLAIM_RETRIES = 5
+
+def _claim_seat(team):
+    # member_count < 8 のときだけ1席確保する（ロックを取らずに1文で判定と加算を行う）
+    return Teams.objects.filter(
+        pk=team.pk,
+        is_open=True,
+        member_count__lt=TEAM_SIZE,
+    ).update(
+        member_count=F("member_count") + 1,
+        # 8人目で閉じる（右辺は更新前の値で評価される）
+        is_open=Case(
+            When(member_count__gte=TEAM_SIZE - 1, then=Value(False)),
+            default=Value(True),
+        ),
+        updated_at=timezone.now(),
+    )
 
-@transaction.atomic
 def assign_team_for_user():
-    # 空きチームをロックして取得（人数少ない順）
-    team = (
-        Teams.objects
-        .select_for_update()
-        .filter(is_open=True)
-        .annotate(member_count=Count("userprofiles"))
-        .filter(member_count__lt=8)
-        .order_by("member_count", "id")
-        .first()
-    )
-
-    if team is None:
-        team = Teams.objects.create(name="Team")  # 仮名
-        team.name = f"Team-{team.id:04d}"
-        team.save(update_fields=["name"])
-        return team
-
-    # 8人目で閉じる
-    if team.member_count + 1 >= 8:
-        team.is_open = False
-        team.save(update_fields=["is_open"])
+    for _ in range(TEAM_CLAIM_RETRIES):
+        # 空きチームを人数少ない順に
+        team = (
+            Teams.objects
+            .filter(is_open=True, member_count__lt=TEAM_SIZE)
+            .order_by("member_count", "id")
+            .first()
+        )
+        if team is None:
+            break
+        if _claim_seat(team):
+            team.member_count += 1
+            team.is_open = team.member_count < TEAM_SIZE
+            return team
 
+    # 空きがない（または取り合いに負け続けた）ときは新しいチームを作る
+    team = Teams.objects.create(name="Team", member_count=1)  # 仮名
+    team.name = f"Team-{team.id:04d}"
+    team.save(update_fields=["name"])
     return team
 
-def get_user_ticket_balance(user):
+def _balance_owner(owner_type, user=None, team=None):
+    if owner_type == TicketTransaction.OwnerType.USER:
+        return {"owner_type": owner_type, "user_id": getattr(user, "pk", user)}
+    return {"owner_type": owner_type, "team_id": getattr(team, "pk", team)}
+
+def _ledger_total(owner_type, user=None, team=None):
     return (
         TicketTransaction.objects
-        .filter(owner_type=TicketTransaction.OwnerType.USER, user=user)
+        .filter(**_balance_owner(owner_type, user=user, team=team))
         .aggregate(total=Sum("amount"))
         .get("total") or 0
     )
 
+def _get_balance(owner_type, user=None, team=None):
+    owner = _balance_owner(owner_type, user=user, team=team)
+    balance = TicketBalance.objects.filter(**owner).values_list("balance", flat=True).first()
+    if balance is None:
+        # スナップショット未作成（既存データ）のときだけ台帳から集計
+        return _ledger_total(owner_type, user=user, team=team)
+    return balance
+
+# 台帳に1行追加されたら、同じトランザクション内で残高を加算する
+def apply_balance_delta(owner_type, amount, user=None, team=None):
+    owner = _balance_owner(owner_type, user=user, team=team)
+    updated = TicketBalance.objects.filter(**owner).update(
+        balance=F("balance") + amount,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        # 初回は台帳の合計（今回の行を含む）から作る
+        TicketBalance.objects.get_or_create(
+            **owner,
+            defaults={"balance": _ledger_total(owner_type, user=user, team=team)},
+        )
+
+# チームの台帳行が増えたら、その日の流入・支出に加算する（初回は台帳のその日の集計から作る）
+def apply_team_pool_daily(team_id, day, income, outcome):
+    updated = TeamPoolDaily.objects.filter(team_id=team_id, day=day).update(
+        income=F("income") + income,
+        outcome=F("outcome") + outcome,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        stats = team_pool_stats_from_ledger(team_id, day)
+        TeamPoolDaily.objects.get_or_create(
+            team_id=team_id,
+            day=day,
+            defaults={"income": stats["income"], "outcome": stats["outcome"]},
+        )
+
+# 予約のステータスが変わったら、その予約の日（start_at のローカル日付）の件数に加算する
+# （初回は予約と台帳のその日の集計から作る。呼び出し元は変更を保存してから呼ぶ）
+def apply_daily_activity(user_id, day, **deltas):
+    updated = UserDailyActivity.objects.filter(user_id=user_id, day=day).update(
+        **{name: F(name) + delta for name, delta in deltas.items()},
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        UserDailyActivity.objects.get_or_create(
+            user_id=user_id,
+            day=day,
+            defaults=daily_activity_from_source(user_id, day),
+        )
+
+def ticket_entry(owner_type, source, ref_type, ref_id, amount, user=None, team=None):
+    """record_ticket_entries に渡す未保存の台帳行を作る。"""
+    return TicketTransaction(
+        owner_type=owner_type,
+        user_id=getattr(user, "pk", user),
+        team_id=getattr(team, "pk", team),
+        source=source,
+        ref_type=ref_type,
+        ref_id=str(ref_id),
+        amount=amount,
+    )
+
+def _entry_key(entry):
+    return (entry.owner_type, entry.user_id, entry.team_id, entry.source, entry.ref_type, entry.ref_id)
+
+def _lock_owners(user_ids, team_ids):
+    """owner（ユーザー・チーム）の行をロックして、同じ owner への台帳の書き込みを直列化する。
+
+    ロックの順番はユーザー → チーム、それぞれ id 順に揃えてデッドロックを避ける。
+    SQLite は SELECT ... FOR UPDATE がないが、書き込みトランザクションが1本ずつで、
+    古い読み取りのまま書こうとしたトランザクションはエラーになるので、ここでは何もしない。
+    """
+    if not connection.features.has_select_for_update:
+        return
+    if user_ids:
+        list(UserProfiles.objects.select_for_update().filter(pk__in=user_ids).order_by("pk").values_list("pk", flat=True))
+    if team_ids:
+        list(Teams.objects.select_for_update().filter(pk__in=team_ids).order_by("pk").values_list("pk", flat=True))
+
+@transaction.atomic
+def record_ticket_entries(entries):
+    """台帳行をまとめて冪等に書き込み、新しく入った行のリストを返す。
+
+    owner の行をロックしてから既存の参照を1回の SELECT で除き、残りを1回の INSERT で入れる。
+    ロックの中で見た「まだない参照」は、そのまま自分が入れた行になる（並行して同じ参照を書く
+    呼び出し元はロックで待たされ、こちらのコミット後の SELECT で既存として除かれる）。
+    残高スナップショット・日次の集計は、新しく入った行の分だけ owner・日ごとに1回ずつ加算する。
+    """
+    batch = {}
+    for entry in entries:
+        batch.setdefault(_entry_key(entry), entry)
+    if not batch:
+        return []
+
+    user_ids = {e.user_id for e in batch.values() if e.user_id is not None}
+    team_ids = {e.team_id for e in batch.values() if e.team_id is not None}
+    _lock_owners(user_ids, team_ids)
+    existing = set(
+        TicketTransaction.objects
+        .filter(ref_id__in={e.ref_id for e in batch.values()})
+        .filter(Q(user_id__in=user_ids) | Q(team_id__in=team_ids))
+        .values_list("owner_type", "user_id", "team_id", "source", "ref_type", "ref_id")
+    )
+    new_entries = [entry for key, entry in batch.items() if key not in existing]
+    TicketTransaction.objects.bulk_create(new_entries, batch_size=500)
+
+    deltas = {}
+    pool_days = {}
+    user_days = {}
+    for entry in new_entries:
+        owner = (entry.owner_type, entry.user_id, entry.team_id)
+        deltas[owner] = deltas.get(owner, 0) + entry.amount
+        day = timezone.localdate(entry.created_at)
+        if entry.owner_type == TicketTransaction.OwnerType.TEAM:
+            flow = pool_days.setdefault((entry.team_id, day), [0, 0])
+            flow[0 if entry.amount > 0 else 1] += abs(entry.amount)
+        else:
+            user_days[(entry.user_id, day)] = user_days.get((entry.user_id, day), 0) + entry.amount
+    for (owner_type, user_id, team_id), amount in deltas.items():
+        apply_balance_delta(owner_type, amount, user=user_id, team=team_id)
+    for (team_id, day), (income, outcome) in pool_days.items():
+        apply_team_pool_daily(team_id, day, income, outcome)
+    for (user_id, day), amount in user_days.items():
+        apply_daily_activity(user_id, day, net_tickets=amount)
+    return new_entries
+
+def _record_ticket(*args, **kwargs):
+    """1行書いて、保存されている行（既にあればその行）を返す。"""
+    return _record_entry(ticket_entry(*args, **kwargs))
+
+def _record_entry(entry):
+    """ticket_entry で作った1行を書いて、保存されている行（既にあればその行）を返す。"""
+    if record_ticket_entries([entry]) and entry.pk is not None:
+        return entry
+    return TicketTransaction.objects.get(
+        owner_type=entry.owner_type,
+        user_id=entry.user_id,
+        team_id=entry.team_id,
+        source=entry.source,
+        ref_type=entry.ref_type,
+        ref_id=entry.ref_id,
+    )
+
+def get_user_ticket_balance(user):
+    return _get_balance(TicketTransaction.OwnerType.USER, user=user)
+
 def get_team_pool_balance(team):
+    return _get_balance(TicketTransaction.OwnerType.TEAM, team=team)
+
+# ==== チームプールの統計（残高・今日の流入・今日の支出） ====
+
+def team_pool_stats_from_ledger(team_id, day):
+    """台帳から条件付き集計1回で出す（検証と、スナップショットがないときの代わり）。"""
+    day_start, day_end = local_day_range(day)
+    on_day = Q(created_at__gte=day_start, created_at__lt=day_end)
     return (
         TicketTransaction.objects
-        .filter(owner_type=TicketTransaction.OwnerType.TEAM, team=team)
-        .aggregate(total=Sum("amount"))
-        .get("total") or 0
+        .filter(owner_type=TicketTransaction.OwnerType.TEAM, team_id=team_id)
+        .aggregate(
+            balance=Coalesce(Sum("amount"), 0),
+            income=Coalesce(Sum("amount", filter=on_day & Q(amount__gt=0)), 0),
+            outcome=Coalesce(-Sum("amount", filter=on_day & Q(amount__lt=0)), 0),
+        )
+    )
+
+def _team_pool_stats_query(team_id, day):
+    rollup = TeamPoolDaily.objects.filter(team_id=OuterRef("pk"), day=day)
+    snapshot = TicketBalance.objects.filter(owner_type=TicketTransaction.OwnerType.TEAM, team_id=OuterRef("pk"))
+    return Teams.objects.filter(pk=team_id).values(
+        balance=Subquery(snapshot.values("balance")[:1]),
+        income=Coalesce(Subquery(rollup.values("income")[:1]), 0),
+        outcome=Coalesce(Subquery(rollup.values("outcome")[:1]), 0),
     )
 
+def get_team_pool_stats(team, day=None):
+    """残高スナップショットと日次集計を1クエリで読む（チームの古さに関係なく一定コスト）。"""
+    team_id = getattr(team, "pk", team)
+    day = day or timezone.localdate()
+    stats = _team_pool_stats_query(team_id, day).first()
+    if stats is None or stats["balance"] is None:
+        return team_pool_stats_from_ledger(team_id, day)
+    return stats
+
+async def aget_team_pool_stats(team, day=None):
+    team_id = getattr(team, "pk", team)
+    day = day or timezone.localdate()
+    stats = await _team_pool_stats_query(team_id, day).afirst()
+    if stats is None or stats["balance"] is None:
+        return await sync_to_async(team_pool_stats_from_ledger)(team_id, day)
+    return stats
+
+# async ビュー用（_get_balance と同じ読み方）
+async def _aget_balance(owner_type, user=None, team=None):
+    owner = _balance_owner(owner_type, user=user, team=team)
+    balance = await TicketBalance.objects.filter(**owner).values_list("balance", flat=True).afirst()
+    if balance is None:
+        total = await TicketTransaction.objects.filter(**owner).aaggregate(total=Sum("amount"))
+        return total["total"] or 0
+    return balance
+
+async def aget_user_ticket_balance(user):
+    return await _aget_balance(TicketTransaction.OwnerType.USER, user=user)
+
+async def aget_team_pool_balance(team):
+    return await _aget_balance(TicketTransaction.OwnerType.TEAM, team=team)
+
+async def aget_user_team(user):
+    """ユーザーのチーム。認証バックエンド（CachedModelBackend）が一緒に読んでいればクエリを投げない。"""
+    if user.team_id is None:
+        return None
+    if UserProfiles.team.is_cached(user):
+        return user.team
+    return await Teams.objects.aget(pk=user.team_id)
+
 def grant_initial_tickets(user):
-    ticket, _ = TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.USER,
+    return _record_ticket(
+        TicketTransaction.OwnerType.USER,
+        TicketSource.INITIAL_GRANT,
+        "initial_grant",
+        user.user_id,
+        INITIAL_TICKETS,
         user=user,
-        source=TicketSource.INITIAL_GRANT,
-        ref_type="initial_grant",
-        ref_id=str(user.user_id),
-        defaults={"amount": 7},
     )
-    return ticket
 
 # 予約時のデポジット：ユーザーチケット -1
 def create_reservation_deposit(user, reservation_id):
-    return TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.USER,
+    return _record_ticket(
+        TicketTransaction.OwnerType.USER,
+        TicketSource.RESERVATION_DEPOSIT,
+        "reservation",
+        reservation_id,
+        -1,
         user=user,
-        source=TicketSource.RESERVATION_DEPOSIT,
-        ref_type="reservation",
-        ref_id=str(reservation_id),
-        defaults={"amount": -1},
-    )[0]
+    )
+
+def _deposit_return_entry(user, reservation_id):
+    return ticket_entry(
+        TicketTransaction.OwnerType.USER,
+        TicketSource.DEPOSIT_RETURN,
+        "reservation",
+        reservation_id,
+        1,
+        user=user,
+    )
+
+def _admin_bonus_entry(user, reservation_id):
+    return ticket_entry(
+        TicketTransaction.OwnerType.USER,
+        TicketSource.ADMIN_BONUS,
+        "reservation",
+        reservation_id,
+        1,
+        user=user,
+    )
 
 # 達成時にデポジットのリターン：ユーザーチケット +1
 def create_deposit_return(user, reservation_id):
-    return TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.USER,
-        user=user,
-        source=TicketSource.DEPOSIT_RETURN,
-        ref_type="reservation",
-        ref_id=str(reservation_id),
-        defaults={"amount": 1},
-    )[0]
+    return _record_entry(_deposit_return_entry(user, reservation_id))
 
 # 達成時の運営ボーナス：ユーザーチケット +1
 def create_admin_bonus(user, reservation_id):
-    return TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.USER,
-        user=user,
-        source=TicketSource.ADMIN_BONUS,
-        ref_type="reservation",
-        ref_id=str(reservation_id),
-        defaults={"amount": 1},
-    )[0]
+    return _record_entry(_admin_bonus_entry(user, reservation_id))
+
+# 達成時のまとめ書き込み：デポジットのリターン +1 と運営ボーナス +1
+def create_completion_rewards(user, reservation_id):
+    return record_ticket_entries([
+        _deposit_return_entry(user, reservation_id),
+        _admin_bonus_entry(user, reservation_id),
+    ])
 
 # 未達時のチケット回収：チームチケット +1
-def create_fail_to_team_pool(team, reservation_id):
-    return TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.TEAM,
+def _fail_to_team_pool_entry(team, reservation_id):
+    return ticket_entry(
+        TicketTransaction.OwnerType.TEAM,
+        TicketSource.FAIL_TO_TEAM_POOL,
+        "reservation",
+        reservation_id,
+        1,
         team=team,
-        source=TicketSource.FAIL_TO_TEAM_POOL,
-        ref_type="reservation",
-        ref_id=str(reservation_id),
-        defaults={"amount": 1},
-    )[0]
+    )
+
+def create_fail_to_team_pool(team, reservation_id):
+    return _record_entry(_fail_to_team_pool_entry(team, reservation_id))
+
+# 未達のまとめて回収（スイーパー用）：entries は (team_id, reservation_id) のリスト
+def create_fail_to_team_pool_bulk(entries):
+    return len(record_ticket_entries([
+        _fail_to_team_pool_entry(team_id, reservation_id)
+        for team_id, reservation_id in entries
+    ]))
 
 # 週1リカバリ用：チームチケット -1, ユーザーチケット +1
 def create_recovery(user, team, ref_id):
-    user_tx, _ = TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.USER,
+    user_tx = ticket_entry(
+        TicketTransaction.OwnerType.USER,
+        TicketSource.RECOVERY,
+        "recovery",
+        ref_id,
+        1,
         user=user,
-        source=TicketSource.RECOVERY,
-        ref_type="recovery",
-        ref_id=str(ref_id),
-        defaults={"amount": 1},
     )
-    team_tx, _ = TicketTransaction.objects.get_or_create(
-        owner_type=TicketTransaction.OwnerType.TEAM,
+    team_tx = ticket_entry(
+        TicketTransaction.OwnerType.TEAM,
+        TicketSource.RECOVERY,
+        "recovery",
+        ref_id,
+        -1,
         team=team,
-        source=TicketSource.RECOVERY,
-        ref_type="recovery",
-        ref_id=str(ref_id),
-        defaults={"amount": -1},
     )
-    return user_tx, team_tx
\ No newline at end of file
+    record_ticket_entries([user_tx, team_tx])
+    return user_tx, team_tx
+
+# 台帳からスナップショットを作り直す（rebuild_ticket_balances コマンド用）
+def compute_ledger_balances():
+    users = dict(
+        TicketTransaction.objects
+        .filter(owner_type=TicketTransaction.OwnerType.USER)
+        .values_list("user_id")
+        .annotate(total=Sum("amount"))
+    )
+    teams = dict(
+        TicketTransaction.objects
+        .filter(owner_type=TicketTransaction.OwnerType.TEAM)
+        .values_list("team_id")
+        .annotate(total=Sum("amount"))
+    )
+    return users, teams
+
+def find_balance_mismatches():
+    users, teams = compute_ledger_balances()
+    mismatches = []
+    snapshots = TicketBalance.objects.values_list("owner_type", "user_id", "team_id", "balance")
+    seen_users, seen_teams = set(), set()
+    for owner_type, user_id, team_id, balance in snapshots:
+        if owner_type == TicketTransaction.OwnerType.USER:
+            seen_users.add(user_id)
+            expected = users.get(user_id, 0)
+            owner_id = user_id
+        else:
+            seen_teams.add(team_id)
+            expected = teams.get(team_id, 0)
+            owner_id = team_id
+        if balance != expected:
+            mismatches.append((owner_type, owner_id, balance, expected))
+    for user_id, total in users.items():
+        if user_id not in seen_users:
+            mismatches.append((TicketTransaction.OwnerType.USER, user_id, None, total))
+    for team_id, total in teams.items():
+        if team_id not in seen_teams:
+            mismatches.append((TicketTransaction.OwnerType.TEAM, team_id, None, total))
+    return mismatches
+
+@transaction.atomic
+def rebuild_ticket_balances():
+    users, teams = compute_ledger_balances()
+    TicketBalance.objects.all().delete()
+    TicketBalance.objects.bulk_create(
+        [
+            TicketBalance(owner_type=TicketTransaction.OwnerType.USER, user_id=user_id, balance=total or 0)
+            for user_id, total in users.items()
+        ] + [
+            TicketBalance(owner_type=TicketTransaction.OwnerType.TEAM, team_id=team_id, balance=total or 0)
+            for team_id, total in teams.items()
+        ],
+        batch_size=1000,
+    )
+    return len(users), len(teams)
+
+def compute_team_pool_daily():
+    """台帳から (team_id, 日付) ごとの流入・支出を集計する。"""
+    rows = (
+        TicketTransaction.objects
+        .filter(owner_type=TicketTransaction.OwnerType.TEAM)
+        .annotate(day=TruncDate("created_at", tzinfo=timezone.get_current_timezone()))
+        .values("team_id", "day")
+        .annotate(
+            income=Coalesce(Sum("amount", filter=Q(amount__gt=0)), 0),
+            outcome=Coalesce(-Sum("amount", filter=Q(amount__lt=0)), 0),
+        )
+    )
+    return {(row["team_id"], row["day"]): (row["income"], row["outcome"]) for row in rows}
+
+def find_team_pool_daily_mismatches():
+    expected = compute_team_pool_daily()
+    actual = {
+        (team_id, day): (income, outcome)
+        for team_id, day, income, outcome
+        in TeamPoolDaily.objects.values_list("team_id", "day", "income", "outcome")
+    }
+    return [
+        (team_id, day, actual.get((team_id, day)), expected.get((team_id, day)))
+        for team_id, day in sorted(expected.keys() | actual.keys())
+        if actual.get((team_id, day), (0, 0)) != expected.get((team_id, day), (0, 0))
+    ]
+
+@transaction.atomic
+def rebuild_team_pool_daily():
+    days = compute_team_pool_daily()
+    TeamPoolDaily.objects.all().delete()
+    TeamPoolDaily.objects.bulk_create(
+        [
+            TeamPoolDaily(team_id=team_id, day=day, income=income, outcome=outcome)
+            for (team_id, day), (income, outcome) in days.items()
+        ],
+        batch_size=1000,
+    )
+    return len(days)
+
+
+# ==== ユーザーの日次アクティビティ（マイページの統計用） ====
+
+def _activity_counts():
+    completed = Q(status="completed") | Q(completed_at__isnull=False)
+    return {
+        "reservations": Count("id"),
+        "completions": Count("id", filter=completed),
+        "misses": Count("id", filter=Q(status="missed")),
+        "recoveries": Count("id", filter=Q(status="recovery")),
+    }
+
+def daily_activity_from_source(user_id, day):
+    """予約と台帳から (user, day) の集計を作る（apply_daily_activity の初回用）。"""
+    start, end = local_day_range(day)
+    counts = Reservation.objects.filter(
+        user_id=user_id, start_at__gte=start, start_at__lt=end,
+    ).aggregate(**_activity_counts())
+    counts["net_tickets"] = TicketTransaction.objects.filter(
+        owner_type=TicketTransaction.OwnerType.USER,
+        user_id=user_id,
+        created_at__gte=start,
+        created_at__lt=end,
+    ).aggregate(total=Coalesce(Sum("amount"), 0))["total"]
+    return counts
+
+def compute_daily_activity():
+    """予約と台帳から (user_id, 日付) ごとの集計を作る。"""
+    tz = timezone.get_current_timezone()
+    empty = {"reservations": 0, "completions": 0, "misses": 0, "recoveries": 0, "net_tickets": 0}
+    days = {}
+    rows = (
+        Reservation.objects
+        .annotate(day=TruncDate("start_at", tzinfo=tz))
+        .values("user_id", "day")
+        .annotate(**_activity_counts())
+    )
+    for row in rows:
+        key = (row.pop("user_id"), row.pop("day"))
+        days[key] = {**empty, **row}
+    tickets = (
+        TicketTransaction.objects
+        .filter(owner_type=TicketTransaction.OwnerType.USER)
+        .annotate(day=TruncDate("created_at", tzinfo=tz))
+        .values("user_id", "day")
+        .annotate(total=Sum("amount"))
+    )
+    for row in tickets:
+        days.setdefault((row["user_id"], row["day"]), dict(empty))["net_tickets"] = row["total"]
+    return days
+
+def find_daily_activity_mismatches():
+    fields = ("reservations", "completions", "misses", "recoveries", "net_tickets")
+    expected = {key: tuple(counts[f] for f in fields) for key, counts in compute_daily_activity().items()}
+    actual = {
+        (row[0], row[1]): row[2:]
+        for row in UserDailyActivity.objects.values_list("user_id", "day", *fields)
+    }
+    zero = (0,) * len(fields)
+    return [
+        (user_id, day, actual.get((user_id, day)), expected.get((user_id, day)))
+        for user_id, day in sorted(expected.keys() | actual.keys())
+        if actual.get((user_id, day), zero) != expected.get((user_id, day), zero)
+    ]
+
+@transaction.atomic
+def rebuild_daily_activity():
+    days = compute_daily_activity()
+    UserDailyActivity.objects.all().delete()
+    UserDailyActivity.objects.bulk_create(
+        [
+            UserDailyActivity(user_id=user_id, day=day, **counts)
+            for (user_id, day), counts in days.items()
+        ],
+        batch_size=1000,
+    )
+    return len(days)
+
+def get_activity_stats(user, today=None):
+    """マイページの通算達成数と今週（月曜はじまり）の予約数・達成数を集計テーブルから1クエリで読む。"""
+    today = today or timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+    this_week = Q(day__gte=week_start, day__lt=week_start + timedelta(days=7))
+    return UserDailyActivity.objects.filter(user=user).aggregate(
+        total_completions=Coalesce(Sum("completions"), 0),
+        week_reservations=Coalesce(Sum("reservations", filter=this_week), 0),
+        week_completions=Coalesce(Sum("completions", filter=this_week), 0),
+    )
+
+# ==== 台帳の履歴（ユーザー・チームごと） ====
+
+LEDGER_PAGE_SIZE = 50
+LEDGER_MAX_PAGE_SIZE = 200
+LEDGER_EXPORT_CHUNK = 2000
+LEDGER_FIELDS = ("id", "created_at", "source", "amount", "ref_type", "ref_id")
+
+def ledger_history(owner_type, owner_id):
+    """owner の台帳行を (created_at, id) の降順で返す（ticket_*_history_idx を使う）。"""
+    owner = _balance_owner(owner_type, user=owner_id, team=owner_id)
+    return TicketTransaction.objects.filter(**owner).order_by("-created_at", "-id")
+
+def get_ledger_page(owner_type, owner_id, cursor=None, limit=LEDGER_PAGE_SIZE):
+    return keyset_page(ledger_history(owner_type, owner_id).only(*LEDGER_FIELDS), cursor, limit)
+
+def serialize_ledger_entry(entry):
+    return {
+        "id": entry.id,
+        "created_at": entry.created_at.isoformat(),
+        "source": entry.source,
+        "amount": entry.amount,
+        "ref_type": entry.ref_type,
+        "ref_id": entry.ref_id,
+    }
+
+def iter_ledger_history(owner_type, owner_id, chunk_size=LEDGER_EXPORT_CHUNK):
+    """エクスポート用に全行を辞書で返すイテレーター（WSGI 用）。chunk_size 行ずつ読むのでメモリは件数によらず一定。"""
+    return ledger_history(owner_type, owner_id).values(*LEDGER_FIELDS).iterator(chunk_size=chunk_size)
+
+def aiter_ledger_history(owner_type, owner_id, chunk_size=LEDGER_EXPORT_CHUNK):
+    """iter_ledger_history の async 版（ASGI 用）。
+
+    StreamingHttpResponse は ASGI では同期イテレーターを、WSGI では async イテレーターを
+    最後まで読んでから返すので、動いているハンドラーに合わせてどちらかを使う。
+    """
+    return ledger_history(owner_type, owner_id).values(*LEDGER_FIELDS).aiterator(chunk_size=chunk_size)
@@ -0,0 +1,31 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_users
+from .models import Teams, UserProfiles
+
+
+# 退会したら席を空ける（assign_team_for_user が member_count を見て割り当てるため）
+@receiver(post_delete, sender=UserProfiles)
+def user_deleted(sender, instance, **kwargs):
+    if instance.team_id:
+        Teams.objects.filter(pk=instance.team_id, member_count__gt=0).update(
+            member_count=F("member_count") - 1,
+        )
+
+
+# 認証バックエンドがキャッシュしているユーザー（とそのチーム）を捨てる
+@receiver([post_save, post_delete], sender=UserProfiles)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_users([instance.pk])
+
+
+# チームを消すとメンバーの team は SET_NULL で外れるので、外れる前（pre_delete）にメンバーを引く
+@receiver([post_save, pre_delete], sender=Teams)
+def team_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    invalidate_cached_users(
+        UserProfiles.objects.filter(team_id=instance.pk).values_list("pk", flat=True)
+    )
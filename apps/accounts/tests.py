@@ -1,3 +1,409 @@
-from django.test import TestCase
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .backends import CachedModelBackend
+from .models import Teams, UserProfiles, TeamPoolDaily, TicketBalance, TicketTransaction, TicketSource, UserDailyActivity
+from apps.reservations.models import Reservation
+from apps.reservations.services import record_completion, sweep_missed_reservations
+from .services import (
+    TEAM_SIZE,
+    aget_user_team,
+    assign_team_for_user,
+    create_admin_bonus,
+    create_completion_rewards,
+    create_deposit_return,
+    create_fail_to_team_pool,
+    create_recovery,
+    create_reservation_deposit,
+    find_balance_mismatches,
+    find_daily_activity_mismatches,
+    find_team_pool_daily_mismatches,
+    get_team_pool_balance,
+    get_team_pool_stats,
+    get_user_ticket_balance,
+    grant_initial_tickets,
+    ledger_history,
+    rebuild_daily_activity,
+    rebuild_team_pool_daily,
+    record_ticket_entries,
+    team_pool_stats_from_ledger,
+    ticket_entry,
+)
+
+
+class TicketBalanceTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+
+    def test_writers_keep_snapshot_in_sync(self):
+        grant_initial_tickets(self.user)
+        create_reservation_deposit(self.user, 1)
+        create_deposit_return(self.user, 1)
+        create_admin_bonus(self.user, 1)
+        create_fail_to_team_pool(self.team, 2)
+        create_recovery(self.user, self.team, ref_id=2)
+
+        self.assertEqual(get_user_ticket_balance(self.user), 9)
+        self.assertEqual(get_team_pool_balance(self.team), 0)
+        self.assertEqual(TicketBalance.objects.get(user=self.user).balance, 9)
+        self.assertEqual(find_balance_mismatches(), [])
+
+    def test_duplicate_write_is_not_counted_twice(self):
+        grant_initial_tickets(self.user)
+        grant_initial_tickets(self.user)
+        first = create_reservation_deposit(self.user, 1)
+        again = create_reservation_deposit(self.user, 1)
+
+        self.assertEqual(get_user_ticket_balance(self.user), 6)
+        # 2回目は既存の行を返す
+        self.assertIsNotNone(first.pk)
+        self.assertEqual(again.pk, first.pk)
+        # 個別の書き込み関数も同じ
+        for write, owner in (
+            (create_deposit_return, self.user), (create_admin_bonus, self.user), (create_fail_to_team_pool, self.team),
+        ):
+            with self.subTest(write.__name__):
+                stored = write(owner, 1)
+                self.assertIsNotNone(stored.pk)
+                self.assertEqual(write(owner, 1).pk, stored.pk)
+
+    def test_batch_reports_only_new_entries(self):
+        create_deposit_return(self.user, 1)
+        create_fail_to_team_pool(self.team, 1)
+        entries = [
+            ticket_entry(TicketTransaction.OwnerType.USER, TicketSource.DEPOSIT_RETURN, "reservation", 1, 1, user=self.user),
+            ticket_entry(TicketTransaction.OwnerType.USER, TicketSource.ADMIN_BONUS, "reservation", 1, 1, user=self.user),
+            ticket_entry(TicketTransaction.OwnerType.TEAM, TicketSource.FAIL_TO_TEAM_POOL, "reservation", 2, 1, team=self.team),
+        ]
+
+        # SAVEPOINT・既存チェック・INSERT・残高2件・チームプールとユーザーの日次集計・RELEASE
+        with self.assertNumQueries(8):
+            new = record_ticket_entries(entries)
+
+        self.assertEqual([e.source for e in new], [TicketSource.ADMIN_BONUS, TicketSource.FAIL_TO_TEAM_POOL])
+        self.assertEqual(record_ticket_entries(entries), [])
+        self.assertEqual(get_user_ticket_balance(self.user), 2)
+        self.assertEqual(get_team_pool_balance(self.team), 2)
+
+    def test_completion_rewards_are_written_once(self):
+        self.assertEqual(len(create_completion_rewards(self.user, 1)), 2)
+        self.assertEqual(create_completion_rewards(self.user, 1), [])
+        self.assertEqual(get_user_ticket_balance(self.user), 2)
+
+    def test_database_rejects_duplicate_refs(self):
+        create_admin_bonus(self.user, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TicketTransaction.objects.create(
+                owner_type=TicketTransaction.OwnerType.USER,
+                user=self.user,
+                source=TicketSource.ADMIN_BONUS,
+                ref_type="reservation",
+                ref_id="1",
+                amount=1,
+            )
+
+    def test_balance_read_is_single_query(self):
+        grant_initial_tickets(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_ticket_balance(self.user), 7)
+
+    def test_rebuild_command_repairs_drift(self):
+        grant_initial_tickets(self.user)
+        # スナップショットを経由しない書き込み（既存データ相当）
+        TicketTransaction.objects.create(
+            owner_type=TicketTransaction.OwnerType.USER,
+            user=self.user,
+            source=TicketSource.ADMIN_BONUS,
+            ref_type="reservation",
+            ref_id="99",
+            amount=1,
+        )
+        self.assertEqual(len(find_balance_mismatches()), 1)
+
+        call_command("rebuild_ticket_balances", stdout=StringIO())
+
+        self.assertEqual(find_balance_mismatches(), [])
+        self.assertEqual(get_user_ticket_balance(self.user), 8)
+
+
+class TeamPoolStatsTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+
+    def test_rollup_matches_conditional_aggregate(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        create_fail_to_team_pool(self.team, 1)
+        TicketTransaction.objects.filter(team=self.team).update(created_at=yesterday)
+        rebuild_team_pool_daily()
+        create_fail_to_team_pool(self.team, 2)
+        create_fail_to_team_pool(self.team, 3)
+        create_recovery(self.user, self.team, ref_id=2)
+
+        with self.assertNumQueries(1):
+            stats = get_team_pool_stats(self.team)
+
+        self.assertEqual(stats, {"balance": 2, "income": 2, "outcome": 1})
+        self.assertEqual(stats, team_pool_stats_from_ledger(self.team.id, timezone.localdate()))
+        self.assertEqual(find_team_pool_daily_mismatches(), [])
+
+    def test_rebuild_restores_rollup(self):
+        create_fail_to_team_pool(self.team, 1)
+        TeamPoolDaily.objects.update(income=9)
+        self.assertEqual(len(find_team_pool_daily_mismatches()), 1)
+
+        call_command("rebuild_ticket_balances", stdout=StringIO())
+
+        self.assertEqual(find_team_pool_daily_mismatches(), [])
+        self.assertEqual(get_team_pool_stats(self.team)["income"], 1)
+
+
+class UserDailyActivityTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        grant_initial_tickets(self.user)
+        self.client.force_login(self.user)
+
+    def _activity(self, start_at):
+        return UserDailyActivity.objects.get(user=self.user, day=timezone.localdate(start_at))
+
+    def test_status_changes_keep_rollup_in_sync(self):
+        now = timezone.now()
+        done = Reservation.objects.create(user=self.user, start_at=now - timedelta(minutes=5), checkin_at=now)
+        missed = Reservation.objects.create(user=self.user, start_at=now - timedelta(hours=2))
+        rebuild_daily_activity()
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.client.post(reverse("reservation_new"), {"date": tomorrow.isoformat(), "time": "10:00"})
+        record_completion(self.user, done.id, "run")
+        sweep_missed_reservations(now=now)
+        self.client.post(reverse("reservation_recovery", args=[missed.id]))
+
+        new = Reservation.objects.get(start_at__date__gt=timezone.localdate())
+        self.assertEqual(self._activity(new.start_at).reservations, 1)
+        self.assertEqual(self._activity(done.start_at).completions, 1)
+        self.assertEqual(self._activity(missed.start_at).misses, 0)
+        self.assertEqual(self._activity(missed.start_at).recoveries, 1)
+        self.assertEqual(find_daily_activity_mismatches(), [])
+
+        response = self.client.get(reverse("mypage"))
+        self.assertEqual(response.context["user"]["total_achievements"], 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        now = timezone.now()
+        # 集計を経由しない書き込み（既存データ相当）
+        Reservation.objects.create(user=self.user, start_at=now, status="completed", completed_at=now)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_daily_activity", "--check", stdout=StringIO())
+
+        call_command("rebuild_daily_activity", stdout=StringIO())
+
+        self.assertEqual(find_daily_activity_mismatches(), [])
+        self.assertEqual(self._activity(now).completions, 1)
+        self.assertEqual(self._activity(now).net_tickets, 7)
+
+
+class LedgerHistoryTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        grant_initial_tickets(self.user)
+        for reservation_id in range(1, 4):
+            create_reservation_deposit(self.user, reservation_id)
+        create_fail_to_team_pool(self.team, 1)
+        self.client.force_login(self.user)
+
+    def test_pages_through_history_newest_first(self):
+        expected = list(
+            TicketTransaction.objects.filter(user=self.user).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get(reverse("ticket_history"), params).json()
+            seen += [entry["id"] for entry in data["entries"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, expected)
+        team = self.client.get(reverse("ticket_history"), {"owner": "team"}).json()
+        self.assertEqual([e["source"] for e in team["entries"]], [TicketSource.FAIL_TO_TEAM_POOL])
+        self.assertEqual(self.client.get(reverse("ticket_history"), {"cursor": "broken"}).status_code, 400)
+
+    def test_only_staff_can_read_other_owners(self):
+        other = UserProfiles.objects.create_user(email="b@example.com", password="pass", display_name="B")
+        grant_initial_tickets(other)
+
+        data = self.client.get(reverse("ticket_history"), {"user_id": other.id}).json()
+        self.assertEqual(data["owner_id"], self.user.id)
+
+        self.user.is_staff = True
+        self.user.save(update_fields=["is_staff"])
+        data = self.client.get(reverse("ticket_history"), {"user_id": other.id}).json()
+        self.assertEqual(data["owner_id"], other.id)
+        self.assertEqual(len(data["entries"]), 1)
+
+    async def test_exports_stream_csv_and_jsonl(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse("ticket_history_export"), {"format": "csv"})
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        lines = body.strip().splitlines()
+        self.assertEqual(lines[0], "id,created_at,source,amount,ref_type,ref_id")
+        self.assertEqual(len(lines), 5)
+
+        response = await self.async_client.get(reverse("ticket_history_export"), {"format": "jsonl", "owner": "team"})
+        rows = [json.loads(line) for line in b"".join([c async for c in response.streaming_content]).splitlines()]
+        self.assertEqual([row["amount"] for row in rows], [1])
+        self.assertIn("tickets-team-", response["Content-Disposition"])
+
+    def test_export_streams_a_sync_iterator_under_wsgi(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("ticket_history_export"), {"format": "csv"})
+
+        # 同期イテレーターのまま渡す（async だと WSGI は全件読んでから送る）
+        self.assertFalse(response.is_async)
+        lines = b"".join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(lines[0], "id,created_at,source,amount,ref_type,ref_id")
+        self.assertEqual(len(lines), 5)
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_history_query_uses_owner_index(self):
+        for owner_type, owner_id in ((TicketTransaction.OwnerType.USER, 1), (TicketTransaction.OwnerType.TEAM, 1)):
+            plan = ledger_history(owner_type, owner_id).explain()
+            self.assertIn("history_idx", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+class CachedUserBackendTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        self.backend = CachedModelBackend()
+
+    def test_second_lookup_reads_user_and_team_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk).team.name, "Team-0001")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).team.name, "Team-0001")
+
+    def test_saving_user_or_team_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.user.display_name = "B"
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).display_name, "B")
+
+        self.team.name = "Renamed"
+        self.team.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).team.name, "Renamed")
+
+        self.team.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk).team)
+
+        UserProfiles.objects.get(pk=self.user.pk).delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    async def test_async_lookup_shares_the_cache(self):
+        user = await self.backend.aget_user(self.user.pk)
+        self.assertEqual(await aget_user_team(user), self.team)
+        # async の中ではクエリを投げられないので、チームが読み込み済みであることを見る
+        self.assertTrue(UserProfiles.team.is_cached(await self.backend.aget_user(self.user.pk)))
+
+    def test_authenticated_requests_skip_user_query(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("mypage"))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("mypage"))
+        self.assertFalse([q for q in queries if 'FROM "accounts_userprofiles"' in q["sql"]])
+        self.assertFalse([q for q in queries if 'FROM "accounts_teams"' in q["sql"]])
+
+
+class AssignTeamTests(TestCase):
+    def test_fills_least_populated_team_and_closes_at_eight(self):
+        teams = [assign_team_for_user() for _ in range(TEAM_SIZE + 1)]
+
+        first = Teams.objects.get(pk=teams[0].pk)
+        self.assertEqual(first.member_count, TEAM_SIZE)
+        self.assertFalse(first.is_open)
+        self.assertNotEqual(teams[-1].pk, first.pk)
+        self.assertEqual(teams[-1].name, f"Team-{teams[-1].pk:04d}")
+
+
+class ConcurrentSignupTests(TransactionTestCase):
+    SIGNUPS = 200
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite uses table locks without a busy timeout; needs a file-backed test database")
+
+    def _signup(self, n):
+        try:
+            with transaction.atomic():
+                team = assign_team_for_user()
+                UserProfiles.objects.create_user(
+                    email=f"user{n}@example.com", password=None, display_name=f"user{n}", team=team,
+                )
+        finally:
+            connection.close()
+
+    def test_parallel_signups_never_overfill_a_team(self):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(self._signup, range(self.SIGNUPS)))
+
+        self.assertEqual(UserProfiles.objects.count(), self.SIGNUPS)
+        actual = dict(
+            Teams.objects.annotate(members=Count("userprofiles")).values_list("id", "members")
+        )
+        for team in Teams.objects.all():
+            self.assertLessEqual(actual[team.id], TEAM_SIZE)
+            self.assertEqual(team.member_count, actual[team.id])
+
+
+class ImportUsersTests(TestCase):
+    def test_imports_csv_into_packed_teams_with_initial_grant(self):
+        UserProfiles.objects.create_user(email="taken@example.com", password="pass", display_name="T")
+        lines = ["email,display_name,password"]
+        lines += [f"user{n}@example.com,User {n}," for n in range(10)]
+        lines += ["taken@example.com,Dup,", "broken,NoEmail,", "user0@example.com,Again,"]
+        lines += ["pw@example.com,HasPassword,s3cret-pass"]
+
+        csv_path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "users.csv"
+        csv_path.write_text("\n".join(lines))
+        call_command("import_users", str(csv_path), workers=1, stdout=StringIO())
+
+        imported = UserProfiles.objects.exclude(email="taken@example.com")
+        self.assertEqual(imported.count(), 11)
+        self.assertEqual(
+            sorted(Teams.objects.values_list("member_count", "is_open")),
+            [(3, True), (8, False)],
+        )
+        self.assertTrue(imported.get(email="pw@example.com").check_password("s3cret-pass"))
+        self.assertFalse(imported.get(email="user1@example.com").has_usable_password())
+        self.assertEqual(get_user_ticket_balance(imported.first()), 7)
+        self.assertEqual(find_balance_mismatches(), [])
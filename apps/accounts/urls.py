@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import signup, login_view, logout_view, csrf, me, mypage
+from .views import signup, login_view, logout_view, csrf, me, mypage, ticket_history, ticket_history_export
 
 urlpatterns = [
     path("csrf/", csrf, name="csrf"),
@@ -8,4 +8,6 @@ urlpatterns = [
     path("logout/", logout_view, name="logout"),
     path("me/", me, name="me"),
     path("mypage/", mypage, name="mypage"),
+    path("tickets/", ticket_history, name="ticket_history"),
+    path("tickets/export/", ticket_history_export, name="ticket_history_export"),
 ]
\ No newline at end of file
@@ -1,17 +1,36 @@
+import asyncio
+import csv
 import json
 import calendar
 from django.contrib.auth import get_user_model, authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.db import IntegrityError, transaction
-from django.db.models import Q
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST, require_http_methods
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from django.shortcuts import render, redirect
-from .services import assign_team_for_user, get_user_ticket_balance, get_team_pool_balance,grant_initial_tickets
-from apps.reservations.models import Reservation
+from .models import TicketTransaction
+from .services import (
+    LEDGER_FIELDS,
+    LEDGER_MAX_PAGE_SIZE,
+    LEDGER_PAGE_SIZE,
+    aget_team_pool_balance,
+    aget_user_team,
+    aget_user_ticket_balance,
+    aiter_ledger_history,
+    assign_team_for_user,
+    get_activity_stats,
+    get_ledger_page,
+    get_user_ticket_balance,
+    grant_initial_tickets,
+    iter_ledger_history,
+    serialize_ledger_entry,
+)
+from apps.common.cursors import InvalidCursor
+from apps.common.replicas import read_from_replica
+from apps.reservations.services import recent_reservations, unrecovered_misses
 from django.utils import timezone
-from datetime import timedelta
 
 
 User = get_user_model()
@@ -104,12 +123,8 @@ def logout_view(request):
     
 
 
-@login_required
-def me(request):
-    user = request.user
-    team = user.team
-
-    return JsonResponse({
+def _me_payload(user, team, user_tickets, team_pool):
+    return {
         "id": user.id,
         "user_id": str(user.user_id),
         "email": user.email,
@@ -119,42 +134,39 @@ def me(request):
             "name": team.name if team else None,
         },
         "balances": {
-            "user_tickets": get_user_ticket_balance(user),
-            "team_pool": get_team_pool_balance(team) if team else 0,
+            "user_tickets": user_tickets,
+            "team_pool": team_pool,
         },
-    })
+    }
+
+@login_required
+@read_from_replica
+async def me(request):
+    user = await request.auser()
+    if user.team_id is None:
+        team, team_pool = None, 0
+        user_tickets = await aget_user_ticket_balance(user)
+    else:
+        team, user_tickets, team_pool = await asyncio.gather(
+            aget_user_team(user),
+            aget_user_ticket_balance(user),
+            aget_team_pool_balance(user.team_id),
+        )
+    return JsonResponse(_me_payload(user, team, user_tickets, team_pool))
 
 @login_required
+@read_from_replica
 def mypage(request):
     user = request.user
 
-    # 実データ
+    # 実データ（件数は日次アクティビティの集計テーブルから読む）
     tickets = get_user_ticket_balance(user)
-    total_achievements = Reservation.objects.filter(
-        user=user
-    ).filter(
-        Q(status="completed") | Q(completed_at__isnull=False)
-    ).count()
-
-    now = timezone.localtime()
-    week_start = now - timedelta(days=now.weekday())
-    week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_end = week_start + timedelta(days=7)
-
-    weekly_reservations_qs = Reservation.objects.filter(
-        user=user,
-        start_at__gte=week_start,
-        start_at__lt=week_end,
-    )
-
-    weekly_reservations = weekly_reservations_qs.count()
-    weekly_achievements = weekly_reservations_qs.filter(
-        Q(status="completed") | Q(completed_at__isnull=False)
-    ).count()
+    activity = get_activity_stats(user)
+    total_achievements = activity["total_completions"]
 
     weekly = {
-        "my_achievements": weekly_achievements,
-        "my_reservations": weekly_reservations,
+        "my_achievements": activity["week_completions"],
+        "my_reservations": activity["week_reservations"],
     }
     weekly["progress_percent"] = int(
         weekly["my_achievements"] / max(1, weekly["my_reservations"]) * 100
@@ -166,7 +178,7 @@ def mypage(request):
     week_of_month = (now.day - 1) // 7 + 1
     weekly["week_label"] = f"Week {week_of_month}/{weeks_in_month}"
 
-    reservations_qs = Reservation.objects.filter(user=user).order_by("-start_at")[:5]
+    reservations_qs = recent_reservations(user)
     reservations = [
         {
             "date": r.start_at.strftime("%Y-%m-%d"),
@@ -176,11 +188,7 @@ def mypage(request):
         for r in reservations_qs
     ]
 
-    missed = Reservation.objects.filter(
-        user=user,
-        status="missed",
-        used_recovery=False,
-    ).order_by("-start_at").first()
+    missed = unrecovered_misses(user).first()
 
     recovery_available = missed is not None
 
@@ -197,4 +205,104 @@ def mypage(request):
         "weekly": weekly,
         "reservations": reservations,
     }
-    return render(request, "mypage.html", context)
\ No newline at end of file
+    return render(request, "mypage.html", context)
+
+
+# =========================
+# チケット履歴（台帳）
+# =========================
+
+def _ledger_owner(request, user):
+    """履歴を見る owner。本人の分か、?owner=team で所属チームの分。
+
+    スタッフ（サポート対応）は ?user_id= / ?team_id= で誰の分でも見られる。
+    """
+    if user.is_staff:
+        for key, owner_type in (("user_id", TicketTransaction.OwnerType.USER), ("team_id", TicketTransaction.OwnerType.TEAM)):
+            if key in request.GET:
+                try:
+                    return owner_type, int(request.GET[key])
+                except ValueError:
+                    raise Http404
+    if request.GET.get("owner") == "team":
+        if user.team_id is None:
+            raise Http404
+        return TicketTransaction.OwnerType.TEAM, user.team_id
+    return TicketTransaction.OwnerType.USER, user.id
+
+@login_required
+@require_GET
+def ticket_history(request):
+    owner_type, owner_id = _ledger_owner(request, request.user)
+
+    try:
+        limit = int(request.GET.get("limit", LEDGER_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "invalid limit"}, status=400)
+    limit = max(1, min(limit, LEDGER_MAX_PAGE_SIZE))
+
+    try:
+        entries, next_cursor = get_ledger_page(owner_type, owner_id, cursor=request.GET.get("cursor"), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+
+    return JsonResponse({
+        "owner_type": owner_type,
+        "owner_id": owner_id,
+        "entries": [serialize_ledger_entry(entry) for entry in entries],
+        "next_cursor": next_cursor,
+    })
+
+
+class _Echo:
+    """csv.writer の書き込み先。書いた1行をそのまま返す。"""
+
+    def write(self, value):
+        return value
+
+def _csv_format():
+    writer = csv.writer(_Echo())
+    return writer.writerow(LEDGER_FIELDS), lambda row: writer.writerow(
+        [row["created_at"].isoformat() if f == "created_at" else row[f] for f in LEDGER_FIELDS]
+    )
+
+def _jsonl_format():
+    return None, lambda row: json.dumps({**row, "created_at": row["created_at"].isoformat()}, ensure_ascii=False) + "\n"
+
+EXPORT_FORMATS = {
+    "csv": (_csv_format, "text/csv; charset=utf-8"),
+    "jsonl": (_jsonl_format, "application/x-ndjson"),
+}
+
+def _export_lines(rows, header, format_row):
+    if header is not None:
+        yield header
+    for row in rows:
+        yield format_row(row)
+
+async def _aexport_lines(rows, header, format_row):
+    if header is not None:
+        yield header
+    async for row in rows:
+        yield format_row(row)
+
+@login_required
+@require_GET
+async def ticket_history_export(request):
+    """台帳の全履歴を CSV / JSONL で流す（?format=csv|jsonl、owner の指定は ticket_history と同じ）。"""
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": "invalid format"}, status=400)
+    user = await request.auser()
+    owner_type, owner_id = _ledger_owner(request, user)
+
+    make_format, content_type = EXPORT_FORMATS[fmt]
+    header, format_row = make_format()
+    # ASGI は async イテレーター、WSGI は同期イテレーターでないと全件読んでから送ってしまう
+    if isinstance(request, ASGIRequest):
+        lines = _aexport_lines(aiter_ledger_history(owner_type, owner_id), header, format_row)
+    else:
+        lines = _export_lines(iter_ledger_history(owner_type, owner_id), header, format_row)
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="tickets-{owner_type.lower()}-{owner_id}.{fmt}"'
+    return response
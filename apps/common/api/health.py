@@ -1,4 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 
+from apps.common.cache import cache_stats
+
 def healthz(request):
     return JsonResponse({"status": "ok"})
+
+# namespace ごとのキャッシュのヒット・ミス・追い出し（このプロセスの起動からの累計）
+@staff_member_required
+def cache_metrics(request):
+    return JsonResponse({"namespaces": cache_stats()})
@@ -0,0 +1,3 @@
+async def alist(qs):
+    """クエリセットを async で評価してリストにする（asyncio.gather に渡せるようにコルーチンにする）。"""
+    return [obj async for obj in qs]
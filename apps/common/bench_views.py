@@ -0,0 +1,59 @@
+# ホットパスの async ビュー（me / dashboard / timeline_list / toggle_like）と比べるための同期版。
+# アプリのビューは async の1実装だけにして、同期版はここにだけ置く。
+# bench_async_views と、async 版と同じ結果になることを確かめるテストがこのモジュールを ROOT_URLCONF にして使う
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import path
+from django.views.decorators.http import require_POST
+
+from apps.accounts.services import get_team_pool_balance, get_user_ticket_balance
+from apps.accounts.views import _me_payload
+from apps.common.replicas import read_from_replica
+from apps.reservations.services import get_dashboard_context
+from apps.timeline.models import TimelinePost
+from apps.timeline.services import build_timeline_context, toggle_post_like
+from config.urls import urlpatterns as async_urlpatterns
+
+
+@login_required
+@read_from_replica
+def me_sync(request):
+    user = request.user
+    team = user.team
+    return JsonResponse(_me_payload(
+        user,
+        team,
+        get_user_ticket_balance(user),
+        get_team_pool_balance(team) if team else 0,
+    ))
+
+
+@login_required
+def dashboard_sync(request):
+    return render(request, "dashboard.html", get_dashboard_context(request.user))
+
+
+@login_required
+@read_from_replica
+def timeline_list_sync(request):
+    return render(request, "timeline/timeline_list.html", build_timeline_context(request.user))
+
+
+@login_required
+@require_POST
+def toggle_like_sync(request, post_id):
+    post = get_object_or_404(TimelinePost, id=post_id)
+    if post.user_id == request.user.id:
+        return JsonResponse({"error": "自分の投稿にはいいねできません"}, status=400)
+    liked, current_count = toggle_post_like(request.user, post)
+    return JsonResponse({"liked": liked, "count": current_count})
+
+
+# 同期版の ROOT_URLCONF（このモジュール）。先に一致したものが使われるので、同期版を前に置く
+urlpatterns = [
+    path("", dashboard_sync, name="dashboard"),
+    path("auth/me/", me_sync, name="me"),
+    path("timeline/", timeline_list_sync, name="timeline_list"),
+    path("timeline/<int:post_id>/like/", toggle_like_sync, name="timeline_like"),
+] + async_urlpatterns
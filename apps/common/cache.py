@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# アプリごとのキャッシュの入口。
+# - キーは "<namespace>:<key>" にして、アプリ同士でぶつからないようにする
+# - 「このユーザーの分を全部捨てる」は、スコープ（"user:1" など）ごとのバージョンを進めて行う。
+#   キャッシュのキーにバージョンを含めておけば、古いキーは読まれなくなり TTL で消える
+# - namespace ごとにヒット・ミス・追い出しを数える（プロセスごとの値。cache_stats() で読む）
+# バックエンドは settings.CACHES で選ぶ（config/settings/caches.py）。Django のキャッシュ API だけを使うので、
+# 本番の Redis でも、開発・テストのプロセス内キャッシュでも同じように動く
+
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+EVENTS = ("hits", "misses", "evictions")
+
+
+def namespace_of(key):
+    """キャッシュのキー（KEY_PREFIX・バージョンを除いた部分）の namespace。namespace のないキーは "other"。"""
+    namespace, sep, _ = key.partition(":")
+    return namespace if sep else "other"
+
+
+def record(namespace, event, n=1):
+    if n:
+        with _stats_lock:
+            _stats[namespace][event] += n
+
+
+def cache_stats():
+    """namespace ごとの {"hits", "misses", "evictions", "hit_rate"}。"""
+    with _stats_lock:
+        snapshot = {namespace: dict(counts) for namespace, counts in _stats.items()}
+    report = {}
+    for namespace, counts in sorted(snapshot.items()):
+        row = {event: counts.get(event, 0) for event in EVENTS}
+        lookups = row["hits"] + row["misses"]
+        row["hit_rate"] = round(row["hits"] / lookups, 3) if lookups else None
+        report[namespace] = row
+    return report
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class CacheNamespace:
+    """namespace つきでキャッシュを読み書きする。get 系はヒット・ミスを数える。
+
+    None はミスとして扱うので、None そのものはキャッシュしない。
+    """
+
+    def __init__(self, namespace, alias="default"):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _version_key(self, scope):
+        return self.key(f"v:{scope}")
+
+    def _count(self, found, requested):
+        record(self.namespace, "hits", found)
+        record(self.namespace, "misses", requested - found)
+
+    def get(self, key):
+        value = self.cache.get(self.key(key))
+        self._count(value is not None, 1)
+        return value
+
+    async def aget(self, key):
+        value = await self.cache.aget(self.key(key))
+        self._count(value is not None, 1)
+        return value
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = self.cache.get_many([self.key(key) for key in keys])
+        self._count(len(found), len(keys))
+        return {key: found[self.key(key)] for key in keys if self.key(key) in found}
+
+    def set(self, key, value, timeout):
+        self.cache.set(self.key(key), value, timeout)
+
+    async def aset(self, key, value, timeout):
+        await self.cache.aset(self.key(key), value, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.key(key) for key in keys])
+
+    # ---- バージョン ----
+
+    def versions(self, *scopes):
+        """スコープごとのバージョン（一度も進めていなければ 0）。キャッシュのキーに含めて使う。"""
+        found = self.cache.get_many([self._version_key(scope) for scope in scopes])
+        return tuple(found.get(self._version_key(scope), 0) for scope in scopes)
+
+    async def aversions(self, *scopes):
+        found = await self.cache.aget_many([self._version_key(scope) for scope in scopes])
+        return tuple(found.get(self._version_key(scope), 0) for scope in scopes)
+
+    def bump(self, *scopes):
+        """スコープのバージョンを進めて、それを含むキーを読まれなくする（期限なしで保存する）。"""
+        version = time.time_ns()
+        self.cache.set_many({self._version_key(scope): version for scope in scopes}, None)
+
+
+class CountingLocMemCache(LocMemCache):
+    """MAX_ENTRIES を超えて追い出したエントリを namespace ごとに数える LocMemCache。"""
+
+    def _cull(self):
+        if self._cull_frequency == 0:
+            evicted = list(self._cache)
+            self._cache.clear()
+            self._expire_info.clear()
+        else:
+            evicted = []
+            for _ in range(len(self._cache) // self._cull_frequency):
+                key, _value = self._cache.popitem()
+                del self._expire_info[key]
+                evicted.append(key)
+        for namespace, n in Counter(namespace_of(self._strip(key)) for key in evicted).items():
+            record(namespace, "evictions", n)
+
+    def _strip(self, key):
+        # make_key() が付けた "<KEY_PREFIX>:<version>:" を外す
+        return key.split(":", 2)[-1]
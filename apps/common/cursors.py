@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# (created_at, id) の降順で並べた一覧のカーソルページング（OFFSET を使わないので深いページでも一定コスト）。
+# カーソルは最後の行の (created_at, id) を JSON にして URL セーフな base64 にしたもの。
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj):
+    raw = json.dumps([obj.created_at.isoformat(), obj.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, obj_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(obj_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def after_cursor(qs, cursor):
+    """order_by("-created_at", "-id") の qs を、カーソルの行より後ろに絞る。"""
+    created_at, obj_id = decode_cursor(cursor)
+    return qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=obj_id))
+
+
+def keyset_page(qs, cursor=None, limit=20):
+    """1ページ分の行と次のカーソル（最後のページなら None）を返す。"""
+    qs = qs.order_by("-created_at", "-id")
+    if cursor:
+        qs = after_cursor(qs, cursor)
+    rows = list(qs[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (encode_cursor(rows[-1]) if has_more else None)
@@ -0,0 +1,22 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+# created_at__date=day のように列を関数で包むとインデックスが使えないので、
+# ローカル日付（TIME_ZONE = Asia/Tokyo）を [start, end) の aware な datetime に直して範囲で絞る。
+
+def local_day_start(day, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def local_day_range(day, tz=None):
+    """day の 0:00 から翌日 0:00 まで。"""
+    return local_day_start(day, tz), local_day_start(day + timedelta(days=1), tz)
+
+
+def local_week_range(day, tz=None):
+    """day を含む週（月曜はじまり）の月曜 0:00 から翌週月曜 0:00 まで。"""
+    monday = day - timedelta(days=day.weekday())
+    return local_day_start(monday, tz), local_day_start(monday + timedelta(days=7), tz)
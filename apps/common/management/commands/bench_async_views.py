@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+from collections import Counter
+
+import django
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from apps.accounts.models import UserProfiles
+from apps.common.metrics import percentile
+from apps.timeline.models import TimelinePost
+
+
+# 同期版のビューは apps.common.bench_views（それ自体が sync モードの ROOT_URLCONF）
+MODES = {
+    "sync": "apps.common.bench_views",
+    "async": "config.urls",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "ホットパスの async ビューと同期ビューを、ASGI アプリに同時接続数を変えて投げて比べる"
+        "（seed_load 済みの DB で実行する。toggle_like は実際にいいねを付け外しする）"
+    )
+
+    ENDPOINTS = ["me", "timeline_list", "dashboard", "toggle_like"]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400, help="エンドポイント・モード・同時接続数ごとのリクエスト数")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+        parser.add_argument("--users", type=int, default=50, help="リクエストを投げるユーザー数")
+        parser.add_argument("--endpoints", nargs="+", choices=self.ENDPOINTS, default=self.ENDPOINTS)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        users = self._sample_users(options["users"])
+        if not users:
+            raise CommandError("no users with a team; run seed_load first")
+        self.csrf_token = get_random_string(32)
+        self.headers = {user.pk: self._headers_for(user) for user in users}
+        self.team_posts = self._team_posts(users)
+
+        app = get_asgi_application()
+        # 1リクエストごとのメトリクスのログが計測結果に混ざらないように
+        logging.getLogger("apps.request_metrics").setLevel(logging.WARNING)
+
+        results = {}
+        for name in options["endpoints"]:
+            results[name] = {}
+            for concurrency in options["concurrency"]:
+                row = {}
+                for mode, urlconf in MODES.items():
+                    with override_settings(ROOT_URLCONF=urlconf):
+                        requests = [self._request_for(name, self.rng.choice(users)) for _ in range(options["requests"])]
+                        # async_to_sync だと全リクエストの同期処理がこのスレッドに寄ってしまうので、
+                        # ASGI サーバーと同じく親スレッドなしでループを回す
+                        row[mode] = asyncio.run(self._run(app, requests, concurrency))
+                results[name][str(concurrency)] = row
+                self._print_row(name, concurrency, row)
+
+        if options["output"]:
+            report = {
+                "meta": {
+                    "created_at": timezone.now().isoformat(),
+                    "django": django.get_version(),
+                    "python": platform.python_version(),
+                    "database": connection.vendor,
+                    "requests": options["requests"],
+                    "users": len(users),
+                },
+                "endpoints": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"wrote {options['output']}")
+
+    # ---- setup ----
+
+    def _sample_users(self, count):
+        ids = list(UserProfiles.objects.filter(team__isnull=False).values_list("id", flat=True))
+        picked = self.rng.sample(ids, min(count, len(ids)))
+        return list(UserProfiles.objects.filter(id__in=picked))
+
+    def _headers_for(self, user):
+        client = Client()
+        client.force_login(user)
+        cookie = f"sessionid={client.cookies['sessionid'].value}; csrftoken={self.csrf_token}"
+        return [
+            (b"host", b"localhost"),
+            (b"cookie", cookie.encode()),
+            (b"x-csrftoken", self.csrf_token.encode()),
+        ]
+
+    def _team_posts(self, users):
+        posts = {}
+        for user in users:
+            posts[user.pk] = list(
+                TimelinePost.objects
+                .filter(team_id=user.team_id)
+                .exclude(user=user)
+                .order_by("-created_at")
+                .values_list("id", flat=True)[:20]
+            ) or [0]
+        return posts
+
+    def _request_for(self, name, user):
+        if name == "toggle_like":
+            return "POST", reverse("timeline_like", args=[self.rng.choice(self.team_posts[user.pk])]), self.headers[user.pk]
+        return "GET", reverse(name), self.headers[user.pk]
+
+    # ---- measurement ----
+
+    async def _run(self, app, requests, concurrency):
+        pending = iter(requests)
+        latencies = []
+        statuses = Counter()
+
+        async def worker():
+            for method, path, headers in pending:
+                started = time.perf_counter()
+                status = await self._call(app, method, path, headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[str(status)] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "n": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "rps": round(len(latencies) / elapsed, 1),
+            "status": dict(statuses),
+        }
+
+    async def _call(self, app, method, path, headers):
+        """ASGI アプリを1リクエスト分呼び出して、ステータスコードを返す。"""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        body_sent = False
+        finished = asyncio.Event()
+        status = None
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await app(scope, receive, send)
+        finished.set()
+        return status
+
+    def _print_row(self, name, concurrency, row):
+        sync, aio = row["sync"], row["async"]
+        for mode, r in row.items():
+            self.stdout.write(
+                f"{name:<14} c={concurrency:<4} {mode:<5} p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms "
+                f"p99={r['p99_ms']:>8.2f}ms rps={r['rps']:>8.1f} status={r['status']}"
+            )
+        ratio = aio["rps"] / sync["rps"] if sync["rps"] else 0
+        self.stdout.write(f"{'':<14} c={concurrency:<4} async/sync rps={ratio:.2f}x")
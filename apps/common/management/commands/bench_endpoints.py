@@ -0,0 +1,239 @@
+import json
+import platform
+import random
+import time
+from datetime import datetime, timedelta
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.models import UserProfiles
+from apps.accounts.services import apply_daily_activity, create_reservation_deposit
+from apps.common.cache import cache_stats, reset_cache_stats
+from apps.common.metrics import percentile, record_queries
+from apps.reservations.models import Reservation
+from apps.reservations.services import MAX_RESERVATIONS_PER_DAY, reservations_near, reservations_on_day
+from apps.timeline.models import TimelinePost
+
+
+class Command(BaseCommand):
+    help = (
+        "主要なエンドポイントをテストクライアントで叩いて、レイテンシ（p50/p95/p99）と"
+        "クエリ数・クエリ時間を JSON で出力する（seed_load 済みの DB で実行する）。"
+        "1リクエストごとにトランザクションをロールバックするので、書き込み系を叩いても DB は変わらない"
+    )
+
+    ENDPOINTS = [
+        "dashboard",
+        "mypage",
+        "me",
+        "timeline_list",
+        "toggle_like",
+        "new_reservation",
+        "complete_reservation",
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200, help="エンドポイントごとのリクエスト数")
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--users", type=int, default=50, help="リクエストを投げるユーザー数")
+        parser.add_argument("--endpoints", nargs="+", choices=self.ENDPOINTS, default=self.ENDPOINTS)
+        parser.add_argument("--seed", type=int, default=0, help="ユーザー・対象の選び方を決める（同じ値なら同じリクエストを投げる）")
+        parser.add_argument("--clear-cache", action="store_true", help="毎リクエスト前にキャッシュを消す（コールド計測）")
+        parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+        parser.add_argument("--compare", help="前回の結果 JSON と比べた差分を表示する")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.clients = {}
+        self.free_slots = {}
+        users = self._sample_users(options["users"])
+        if not users:
+            raise CommandError("no users with a team; run seed_load first")
+
+        results = {}
+        for name in options["endpoints"]:
+            prepare = getattr(self, f"_prepare_{name}")
+            eligible = getattr(self, f"_users_for_{name}", None)
+            callers = eligible(users) if eligible else users
+            if not callers:
+                raise CommandError(f"none of the sampled users can call {name}")
+            for _ in range(options["warmup"]):
+                self._measure(prepare, callers, clear_cache=options["clear_cache"])
+            reset_cache_stats()
+            samples = [
+                self._measure(prepare, callers, clear_cache=options["clear_cache"])
+                for _ in range(options["iterations"])
+            ]
+            results[name] = self._summarize(samples)
+            results[name]["cache"] = cache_stats()
+            self._print_row(name, results[name])
+
+        report = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "iterations": options["iterations"],
+                "users": len(users),
+                "clear_cache": options["clear_cache"],
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"wrote {options['output']}")
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self._print_comparison(json.load(f), report)
+
+    # ---- measurement ----
+
+    def _sample_users(self, count):
+        ids = list(UserProfiles.objects.filter(team__isnull=False).values_list("id", flat=True))
+        picked = self.rng.sample(ids, min(count, len(ids)))
+        return list(UserProfiles.objects.filter(id__in=picked))
+
+    def _client_for(self, user):
+        # ログイン（セッション作成）は最初の1回だけ
+        if user.pk not in self.clients:
+            client = Client(HTTP_HOST="localhost")
+            client.force_login(user)
+            self.clients[user.pk] = client
+        return self.clients[user.pk]
+
+    def _measure(self, prepare, users, clear_cache=False):
+        user = self.rng.choice(users)
+        # ログインはロールバックの外で（セッションを残す）
+        client = self._client_for(user)
+        # 準備とリクエストの書き込みは毎回ロールバックして、どのリクエストも seed_load 直後と同じ DB に投げる
+        # （テストクライアントは同じスレッド・同じ接続で動くので、ビューのトランザクションはこの中のセーブポイントになる）
+        with transaction.atomic():
+            # 準備（対象の投稿や予約を作る）は計測に含めない
+            method, url, data = prepare(user)
+            if clear_cache:
+                cache.clear()
+
+            with record_queries() as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data or {})
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        return {
+            "ms": elapsed * 1000,
+            "queries": queries.count,
+            "query_ms": queries.seconds * 1000,
+            "status": response.status_code,
+        }
+
+    def _summarize(self, samples):
+        latencies = [s["ms"] for s in samples]
+        statuses = {}
+        for s in samples:
+            statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+        return {
+            "n": len(samples),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "queries_mean": round(sum(s["queries"] for s in samples) / len(samples), 2),
+            "queries_max": max(s["queries"] for s in samples),
+            "query_ms_mean": round(sum(s["query_ms"] for s in samples) / len(samples), 3),
+            "status": statuses,
+        }
+
+    def _print_row(self, name, r):
+        self.stdout.write(
+            f"{name:<22} p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms "
+            f"queries={r['queries_mean']:>5.1f} (max {r['queries_max']}) sql={r['query_ms_mean']:>7.2f}ms "
+            f"status={r['status']}"
+        )
+
+    def _print_comparison(self, before, after):
+        self.stdout.write("")
+        self.stdout.write("change vs baseline (after - before):")
+        for name, new in after["endpoints"].items():
+            old = before.get("endpoints", {}).get(name)
+            if old is None:
+                continue
+            parts = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "queries_mean", "query_ms_mean"):
+                delta = new[key] - old[key]
+                ratio = f" ({delta / old[key] * 100:+.0f}%)" if old[key] else ""
+                parts.append(f"{key}={delta:+.2f}{ratio}")
+            self.stdout.write(f"{name:<22} " + " ".join(parts))
+
+    # ---- endpoints: (method, url, data) を返す ----
+
+    def _prepare_dashboard(self, user):
+        return "get", reverse("dashboard"), None
+
+    def _prepare_mypage(self, user):
+        return "get", reverse("mypage"), None
+
+    def _prepare_me(self, user):
+        return "get", reverse("me"), None
+
+    def _prepare_timeline_list(self, user):
+        return "get", reverse("timeline_list"), None
+
+    def _prepare_toggle_like(self, user):
+        post_id = (
+            TimelinePost.objects
+            .filter(team_id=user.team_id)
+            .exclude(user=user)
+            .order_by("-created_at")
+            .values_list("id", flat=True)[:20]
+        )
+        post_id = self.rng.choice(list(post_id) or [0])
+        return "post", reverse("timeline_like", args=[post_id]), None
+
+    def _free_slots_for(self, user):
+        """予約フォームを通る枠（今日・明日の 6:00〜22:30、30分刻み）。DB は毎回ロールバックするのでユーザーごとに1回だけ調べる。"""
+        if user.pk not in self.free_slots:
+            now = timezone.now()
+            today = timezone.localdate(now)
+            slots = []
+            for day in (today, today + timedelta(days=1)):
+                if reservations_on_day(user, day).count() >= MAX_RESERVATIONS_PER_DAY:
+                    continue
+                for minutes in range(6 * 60, 23 * 60, 30):
+                    start_at = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes))
+                    # 計測中に過去にならないよう少し先から
+                    if start_at > now + timedelta(minutes=30) and not reservations_near(user, start_at).exists():
+                        slots.append(start_at)
+            self.free_slots[user.pk] = slots
+        return self.free_slots[user.pk]
+
+    def _users_for_new_reservation(self, users):
+        # 空き枠のないユーザーで計測するとフォームのエラー（再表示）を測ってしまう
+        return [user for user in users if self._free_slots_for(user)]
+
+    def _prepare_new_reservation(self, user):
+        start_at = timezone.localtime(self.rng.choice(self._free_slots_for(user)))
+        return "post", reverse("reservation_new"), {
+            "date": start_at.date().isoformat(),
+            "time": start_at.strftime("%H:%M"),
+        }
+
+    def _prepare_complete_reservation(self, user):
+        # new_reservation と同じく、予約・予約数・デポジットをそろえてから完了させる
+        now = timezone.now()
+        reservation = Reservation.objects.create(
+            user=user, team_id=user.team_id, start_at=now - timedelta(minutes=5), checkin_at=now,
+        )
+        apply_daily_activity(user.id, timezone.localdate(reservation.start_at), reservations=1)
+        create_reservation_deposit(user, reservation.id)
+        return "post", reverse("reservation_complete", args=[reservation.id]), {
+            "activity_type": self.rng.choice(["walk", "run", "workout", "other"]),
+            "memo": "bench",
+        }
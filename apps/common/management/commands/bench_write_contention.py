@@ -0,0 +1,162 @@
+import json
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.accounts.models import Teams, UserProfiles, TicketBalance, TicketTransaction, TicketSource
+from apps.common.metrics import percentile
+from config.settings.databases import sqlite_database
+
+
+PROFILES = {
+    # Django の SQLite の既定のまま（DEFERRED・rollback ジャーナル・timeout 5秒）。チューニング前の比較用
+    "default": lambda path: sqlite_database(path),
+    # base.py / prod.py と同じ（WAL・synchronous=NORMAL・BEGIN IMMEDIATE・timeout 20秒）
+    "tuned": lambda path: sqlite_database(path, tuned=True),
+}
+
+MODELS = [Teams, UserProfiles, TicketTransaction, TicketBalance]
+
+
+class Command(BaseCommand):
+    help = (
+        "一時ファイルの SQLite に、台帳の書き込み（既存チェック → INSERT → 残高 UPDATE）を"
+        "スレッド数を変えて同時に投げ、Django の既定の設定とこのアプリの設定で比べる"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ops", type=int, default=2000, help="プロファイル・スレッド数ごとの書き込み回数")
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+        parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+
+    def handle(self, *args, **options):
+        tmpdir = Path(tempfile.mkdtemp(prefix="bench_write_contention_"))
+        results = {}
+        try:
+            for name in options["profiles"]:
+                results[name] = {}
+                for threads in options["threads"]:
+                    alias = f"bench_{name}_{threads}"
+                    self._add_database(alias, PROFILES[name](tmpdir / f"{alias}.sqlite3"))
+                    try:
+                        user_ids = self._setup(alias, threads)
+                        row = self._run(alias, user_ids, options["ops"])
+                    finally:
+                        self._remove_database(alias)
+                    results[name][str(threads)] = row
+                    self._print_row(name, threads, row)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        if options["output"]:
+            report = {
+                "meta": {
+                    "created_at": timezone.now().isoformat(),
+                    "django": django.get_version(),
+                    "python": platform.python_version(),
+                    "ops": options["ops"],
+                },
+                "profiles": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"wrote {options['output']}")
+
+    # ---- setup ----
+
+    def _add_database(self, alias, database):
+        configured = connections.configure_settings({DEFAULT_DB_ALIAS: {}, alias: database})
+        connections.settings[alias] = configured[alias]
+
+    def _remove_database(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def _setup(self, alias, threads):
+        with connections[alias].schema_editor() as editor:
+            for model in MODELS:
+                editor.create_model(model)
+        team = Teams.objects.using(alias).create(name="Team-bench")
+        users = UserProfiles.objects.using(alias).bulk_create([
+            UserProfiles(email=f"bench{n}@example.com", display_name=f"bench{n}", team=team)
+            for n in range(threads)
+        ])
+        TicketBalance.objects.using(alias).bulk_create([
+            TicketBalance(owner_type=TicketTransaction.OwnerType.USER, user=user) for user in users
+        ])
+        return [user.id for user in users]
+
+    # ---- measurement ----
+
+    def _write(self, alias, user_id, ref_id):
+        """record_ticket_entries と同じ形：読んでから書く1トランザクション。"""
+        with transaction.atomic(using=alias):
+            ledger = TicketTransaction.objects.using(alias)
+            if ledger.filter(user_id=user_id, ref_type="bench", ref_id=ref_id).exists():
+                return
+            ledger.create(
+                owner_type=TicketTransaction.OwnerType.USER,
+                user_id=user_id,
+                source=TicketSource.ADMIN_BONUS,
+                ref_type="bench",
+                ref_id=ref_id,
+                amount=1,
+            )
+            TicketBalance.objects.using(alias).filter(user_id=user_id).update(balance=F("balance") + 1)
+
+    def _run(self, alias, user_ids, ops):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(n, user_id):
+            mine, failed = [], 0
+            try:
+                for i in range(n, ops, len(user_ids)):
+                    started = time.perf_counter()
+                    try:
+                        self._write(alias, user_id, str(i))
+                    except OperationalError:
+                        failed += 1
+                        continue
+                    mine.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[alias].close()
+            with lock:
+                latencies.extend(mine)
+                errors.append(failed)
+
+        workers = [threading.Thread(target=worker, args=(n, user_id)) for n, user_id in enumerate(user_ids)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            "ok": len(latencies),
+            "locked": sum(errors),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "ops_per_s": round(len(latencies) / elapsed, 1),
+        }
+
+    def _print_row(self, name, threads, r):
+        self.stdout.write(
+            f"{name:<8} threads={threads:<4} ok={r['ok']:<6} locked={r['locked']:<5} "
+            f"p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms "
+            f"ops/s={r['ops_per_s']:>8.1f}"
+        )
@@ -0,0 +1,270 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, LPad
+from django.utils import timezone
+
+from apps.accounts.models import Teams, UserProfiles, TicketTransaction, TicketSource
+from apps.accounts.services import rebuild_daily_activity, rebuild_team_pool_daily, rebuild_ticket_balances
+from apps.common.dates import local_day_start
+from apps.reservations.models import Reservation
+from apps.timeline.models import TimelinePost, Like
+
+
+# 1日のうち予約を入れるメンバーの割合 / そのうち2枠入れる割合
+RESERVE_RATE = 0.8
+SECOND_SLOT_RATE = 0.25
+# 過去の予約の結末
+COMPLETE_RATE = 0.75
+# 未達成のうちリカバリーする割合（週1回まで）
+RECOVER_RATE = 0.3
+SHARE_DETAIL_RATE = 0.5
+# チームメイトの投稿にいいねする確率
+LIKE_RATE = 0.35
+
+ACTIVITIES = [key for key, _ in Reservation.ACTIVITY_CHOICES]
+MEMOS = ["", "", "いい汗かいた", "朝ラン気持ちいい", "ちょっとサボり気味", "新記録！"]
+
+USER = TicketTransaction.OwnerType.USER
+TEAM = TicketTransaction.OwnerType.TEAM
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """bulk_create で created_at / updated_at を過去日付のまま入れるため auto_now(_add) を止める。
+
+    モデルのフィールド定義そのものを書き換えるので、止めている間はプロセス内のどの save() も
+    created_at / updated_at を入れなくなる。seed_load のような単発のコマンドの中だけで使い、
+    リクエストを処理するプロセス（runserver・ASGI / WSGI サーバー、その中のスレッド）では決して使わないこと。
+    """
+    fields = [
+        f for model in models for f in model._meta.fields
+        if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "負荷計測用に、チーム・ユーザー・予約・台帳・タイムライン・いいねを bulk_create で大量に作る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teams", type=int, default=100)
+        parser.add_argument("--days", type=int, default=28, help="何日分の履歴を作るか")
+        parser.add_argument("--min-members", type=int, default=4)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--chunk", type=int, default=50, help="1トランザクションで作るチーム数")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--prefix", default="load", help="メールアドレスの接頭辞（再実行時に変える）")
+        parser.add_argument("--password", default="password")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.password = make_password(options["password"])
+        self.now = timezone.now()
+        today = timezone.localdate(self.now)
+        self.days = [today - timedelta(days=n) for n in range(options["days"], -2, -1)]
+
+        totals = {}
+        started = time.monotonic()
+        remaining = options["teams"]
+        chunk_no = 0
+        while remaining > 0:
+            size = min(options["chunk"], remaining)
+            with transaction.atomic(), keep_timestamps(
+                Teams, UserProfiles, TicketTransaction, Reservation, TimelinePost, Like,
+            ):
+                counts = self._seed_chunk(size, options["min_members"], f"{options['prefix']}{chunk_no}")
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+            remaining -= size
+            chunk_no += 1
+            elapsed = time.monotonic() - started
+            rows = sum(totals.values())
+            self.stdout.write(
+                f"teams {options['teams'] - remaining}/{options['teams']} "
+                f"rows={rows} elapsed={elapsed:.1f}s rate={rows / elapsed:.0f}/s"
+            )
+
+        users, teams = rebuild_ticket_balances()
+        totals["balances"] = users + teams
+        totals["pool_days"] = rebuild_team_pool_daily()
+        totals["user_days"] = rebuild_daily_activity()
+        summary = " ".join(f"{key}={value}" for key, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"done in {time.monotonic() - started:.1f}s: {summary}"))
+
+    # ---- generation ----
+
+    def _seed_chunk(self, team_count, min_members, prefix):
+        rng = self.rng
+        created = self.now - timedelta(days=len(self.days) + rng.randint(1, 30))
+
+        sizes = [rng.randint(min_members, 8) for _ in range(team_count)]
+        teams = Teams.objects.bulk_create(
+            [
+                Teams(name="Team", is_open=size < 8, member_count=size, created_at=created, updated_at=created)
+                for size in sizes
+            ],
+            batch_size=self.batch_size,
+        )
+        # 名前は id が決まってから1回の UPDATE で付ける（assign_team_for_user と同じ Team-0001 形式）
+        Teams.objects.filter(id__in=[team.id for team in teams]).update(
+            name=Concat(Value("Team-"), LPad(Cast("id", CharField()), 4, Value("0"))),
+        )
+
+        users = [
+            UserProfiles(
+                email=f"{prefix}-{team.id}-{n}@example.com",
+                display_name=f"user{team.id}-{n}",
+                password=self.password,
+                team=team,
+                created_at=created,
+                updated_at=created,
+            )
+            for team, size in zip(teams, sizes)
+            for n in range(size)
+        ]
+
+        # 予約を先に組み立てて last_recovery_at を決めてから、ユーザーを1回で INSERT する
+        reservations = []
+        recovered_weeks = set()
+        for user in users:
+            for day in self.days:
+                if rng.random() > RESERVE_RATE:
+                    continue
+                hours = [rng.randint(6, 11)]
+                if rng.random() < SECOND_SLOT_RATE:
+                    hours.append(rng.randint(15, 22))
+                for hour in hours:
+                    start_at = local_day_start(day) + timedelta(hours=hour, minutes=rng.choice([0, 15, 30, 45]))
+                    reservations.append(self._reservation(user, start_at, recovered_weeks))
+
+        users = UserProfiles.objects.bulk_create(users, batch_size=self.batch_size)
+        reservations = Reservation.objects.bulk_create(reservations, batch_size=self.batch_size)
+
+        ledger = [
+            TicketTransaction(
+                owner_type=USER, user=user, source=TicketSource.INITIAL_GRANT,
+                ref_type="initial_grant", ref_id=str(user.user_id), amount=7, created_at=created,
+            )
+            for user in users
+        ]
+        members_by_team = {}
+        for user in users:
+            members_by_team.setdefault(user.team_id, []).append(user)
+
+        posts = []
+        likers = []
+        for r in reservations:
+            ledger += self._ledger_rows(r)
+            if r.status != "completed":
+                continue
+            fans = [
+                mate for mate in members_by_team[r.team_id]
+                if mate.id != r.user_id and rng.random() < LIKE_RATE
+            ]
+            posts.append(TimelinePost(
+                user=r.user, team=r.team, reservation=r,
+                visibility="with_detail" if r.share_detail else "summary_only",
+                like_count=len(fans),
+                created_at=r.completed_at, updated_at=r.completed_at,
+            ))
+            likers.append(fans)
+        TicketTransaction.objects.bulk_create(ledger, batch_size=self.batch_size)
+        posts = TimelinePost.objects.bulk_create(posts, batch_size=self.batch_size)
+
+        likes = [
+            Like(
+                user=mate, post=post,
+                created_at=min(self.now, post.created_at + timedelta(minutes=rng.randint(1, 600))),
+            )
+            for post, fans in zip(posts, likers)
+            for mate in fans
+        ]
+        Like.objects.bulk_create(likes, batch_size=self.batch_size)
+
+        return {
+            "teams": len(teams),
+            "users": len(users),
+            "reservations": len(reservations),
+            "ledger": len(ledger),
+            "posts": len(posts),
+            "likes": len(likes),
+        }
+
+    def _reservation(self, user, start_at, recovered_weeks):
+        rng = self.rng
+        r = Reservation(
+            user=user, team=user.team, start_at=start_at,
+            # 明日の枠でも予約した時刻（created_at）は今より後にしない
+            created_at=min(self.now, start_at - timedelta(hours=rng.randint(1, 30))),
+        )
+        r.updated_at = r.created_at
+        if start_at + timedelta(minutes=30) > self.now:
+            return r
+
+        if rng.random() < COMPLETE_RATE:
+            r.status = "completed"
+            r.checkin_at = start_at + timedelta(minutes=rng.randint(-10, 20))
+            r.completed_at = min(self.now, r.checkin_at + timedelta(minutes=rng.randint(15, 90)))
+            r.activity_type = rng.choice(ACTIVITIES)
+            r.memo = rng.choice(MEMOS)
+            r.share_detail = rng.random() < SHARE_DETAIL_RATE
+            r.updated_at = r.completed_at
+            return r
+
+        r.status = "missed"
+        r.updated_at = start_at + timedelta(minutes=31)
+        week = (user.pk, start_at.isocalendar()[:2])
+        if week not in recovered_weeks and rng.random() < RECOVER_RATE:
+            recovered_weeks.add(week)
+            r.status = "recovery"
+            r.used_recovery = True
+            r.updated_at = min(self.now, start_at + timedelta(hours=rng.randint(1, 48)))
+            if user.last_recovery_at is None or r.updated_at > user.last_recovery_at:
+                user.last_recovery_at = r.updated_at
+        return r
+
+    def _ledger_rows(self, r):
+        ref = str(r.id)
+        rows = [TicketTransaction(
+            owner_type=USER, user_id=r.user_id, source=TicketSource.RESERVATION_DEPOSIT,
+            ref_type="reservation", ref_id=ref, amount=-1, created_at=r.created_at,
+        )]
+        if r.status == "completed":
+            for source in (TicketSource.DEPOSIT_RETURN, TicketSource.ADMIN_BONUS):
+                rows.append(TicketTransaction(
+                    owner_type=USER, user_id=r.user_id, source=source,
+                    ref_type="reservation", ref_id=ref, amount=1, created_at=r.completed_at,
+                ))
+        elif r.status in ("missed", "recovery"):
+            missed_at = r.start_at + timedelta(minutes=31)
+            rows.append(TicketTransaction(
+                owner_type=TEAM, team_id=r.team_id, source=TicketSource.FAIL_TO_TEAM_POOL,
+                ref_type="reservation", ref_id=ref, amount=1, created_at=missed_at,
+            ))
+            if r.status == "recovery":
+                rows += [
+                    TicketTransaction(
+                        owner_type=USER, user_id=r.user_id, source=TicketSource.RECOVERY,
+                        ref_type="recovery", ref_id=ref, amount=1, created_at=r.updated_at,
+                    ),
+                    TicketTransaction(
+                        owner_type=TEAM, team_id=r.team_id, source=TicketSource.RECOVERY,
+                        ref_type="recovery", ref_id=ref, amount=-1, created_at=r.updated_at,
+                    ),
+                ]
+        return rows
@@ -0,0 +1,55 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_SPACES = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    """パラメータ違い・IN 句の長さ違いを同じ形として数えるための正規化。"""
+    return _IN_LIST.sub("IN (...)", _SPACES.sub(" ", sql.strip()))
+
+
+class QueryRecorder:
+    """connection.execute_wrapper 用。クエリ数・合計時間・形ごとの回数を数える（DEBUG に依存しない）。"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        """threshold 回以上実行された同じ形のクエリ（N+1 の疑い）。"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def percentile(values, p):
+    """nearest-rank 方式のパーセンタイル。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
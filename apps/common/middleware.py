@@ -0,0 +1,94 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import record_queries
+
+
+logger = logging.getLogger("apps.request_metrics")
+
+
+class RequestMetricsMiddleware:
+    """リクエストごとのビュー名・処理時間・SQL 数・SQL 時間・重複クエリを記録する。
+
+    REQUEST_METRICS_SAMPLE_RATE の割合のリクエストだけ計測するので、本番でも常時有効にできる。
+    結果は Server-Timing ヘッダーと apps.request_metrics ロガーに出す。
+    async ビューの前に置いてもスレッドを挟まないよう、同期・非同期の両方に対応する。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0)
+        self.n_plus_one_threshold = getattr(settings, "REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with record_queries() as queries:
+            response = self.get_response(request)
+        return self._report(request, response, queries, started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        # async ORM のクエリはリクエスト専用の同期スレッドで実行されるので、計測もそのスレッドで仕掛ける
+        started = time.perf_counter()
+        recording = record_queries()
+        queries = await sync_to_async(recording.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.__exit__)(None, None, None)
+        return self._report(request, response, queries, started)
+
+    def _report(self, request, response, queries, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = queries.seconds * 1000
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else None
+        repeated = queries.repeated(self.n_plus_one_threshold)
+
+        response["Server-Timing"] = ", ".join([
+            f"total;dur={total_ms:.1f}",
+            f'db;dur={db_ms:.1f};desc="{queries.count} queries"',
+            f"app;dur={max(0.0, total_ms - db_ms):.1f}",
+        ])
+
+        fields = {
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(total_ms, 2),
+            "db_queries": queries.count,
+            "db_ms": round(db_ms, 2),
+            "duplicate_queries": sum(n - 1 for n in queries.shapes.values() if n > 1),
+        }
+        logger.info(
+            " ".join(f"{key}={value}" for key, value in fields.items()),
+            extra={"metrics": fields},
+        )
+        for shape, n in repeated:
+            logger.warning(
+                "possible N+1 in view=%s: %d x %s", view, n, shape,
+                extra={"metrics": {"view": view, "repeats": n, "sql": shape}},
+            )
+        return response
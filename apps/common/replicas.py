@@ -0,0 +1,111 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+
+# 読み取り専用のビューだけ、SELECT をレプリカ（settings.REPLICA_DATABASE）に向ける。
+# - ビューは @read_from_replica で明示的にオプトインする（書き込みのあるビューには付けない）
+# - @login_required の内側（下）に付ける。ログイン中のユーザーの読み込みは primary で行い、
+#   認証バックエンドのキャッシュにレプリカの古い行が入らないようにする
+# - 読んだ結果をキャッシュするビュー（dashboard）には付けない。遅れたレプリカの内容が
+#   無効化のあとの新しいキーで TTL の間残ってしまう
+# - レプリカが設定されていなければ primary（default）を読む
+# - 書き込んだ直後の数秒は、そのユーザーの読み取りも primary に固定する（read-your-writes）
+# 書き込みはいつも primary。セッションはレプリカの遅れでログアウト扱いにならないよう primary から読む
+
+_read_alias = ContextVar("read_alias", default=None)
+
+# セッションなど、遅れたレプリカから読むと困るアプリ
+PRIMARY_ONLY_APPS = {"sessions"}
+
+
+def replica_alias():
+    """設定済みのレプリカの alias。なければ None。"""
+    alias = getattr(settings, "REPLICA_DATABASE", "replica")
+    return alias if alias in connections.settings else None
+
+
+def _sticky_seconds():
+    return getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+
+
+def _pin_cookie():
+    return getattr(settings, "REPLICA_PIN_COOKIE", "primary_until")
+
+
+def _pinned_to_primary(request):
+    pinned_until = request.COOKIES.get(_pin_cookie())
+    try:
+        return pinned_until is not None and float(pinned_until) > time.time()
+    except ValueError:
+        return False
+
+
+def read_from_replica(view):
+    """ビューの中の読み取りをレプリカに向けるデコレーター（同期・async ビューの両方に使える）。"""
+
+    def alias_for(request):
+        if _pinned_to_primary(request):
+            return None
+        return replica_alias()
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _read_alias.set(alias_for(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _read_alias.set(alias_for(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """@read_from_replica の中の読み取りだけレプリカに、それ以外は primary に向ける。"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # primary とレプリカは同じデータなので、どちらから読んだ行同士でも関連づけてよい
+        return True
+
+
+class ReplicaStickinessMiddleware(MiddlewareMixin):
+    """書き込み（GET / HEAD / OPTIONS 以外）のあと、REPLICA_STICKY_SECONDS の間そのクライアントの読み取りを primary に固定する。
+
+    固定の期限は Cookie に入れるので、複数ワーカーでもサーバー側の状態はいらない。
+    """
+
+    def process_response(self, request, response):
+        if request.method in ("GET", "HEAD", "OPTIONS") or response.status_code >= 400:
+            return response
+        if replica_alias() is None:
+            return response
+        seconds = _sticky_seconds()
+        response.set_cookie(
+            _pin_cookie(),
+            f"{time.time() + seconds:.3f}",
+            max_age=seconds,
+            httponly=True,
+            samesite="Lax",
+        )
+        return response
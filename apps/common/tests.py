@@ -0,0 +1,291 @@
+import logging
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import CacheNamespace, cache_stats, reset_cache_stats
+from .dates import local_day_range, local_week_range
+from .metrics import QueryRecorder, query_shape
+from .replicas import read_from_replica
+from apps.accounts.models import Teams, TicketBalance, TicketTransaction, UserProfiles
+from apps.accounts.services import INITIAL_TICKETS, grant_initial_tickets
+from apps.reservations.models import Reservation
+from config.settings.caches import CACHED_AUTH_BACKEND, cache_from_env, require_shared_cache
+from config.settings.databases import SQLITE_BUSY_TIMEOUT, database_from_env, sqlite_database
+
+
+TOKYO = ZoneInfo("Asia/Tokyo")
+
+
+class LocalDateRangeTests(SimpleTestCase):
+    def test_day_range_is_half_open_local_day(self):
+        start, end = local_day_range(date(2026, 2, 3))
+        self.assertEqual(start, datetime(2026, 2, 3, tzinfo=TOKYO))
+        self.assertEqual(end, datetime(2026, 2, 4, tzinfo=TOKYO))
+
+    def test_week_range_starts_on_monday(self):
+        # 2026-02-05 は木曜
+        start, end = local_week_range(date(2026, 2, 5))
+        self.assertEqual(start, datetime(2026, 2, 2, tzinfo=TOKYO))
+        self.assertEqual(end, datetime(2026, 2, 9, tzinfo=TOKYO))
+
+
+class TunedSqliteTests(SimpleTestCase):
+    def test_connection_applies_pragmas_and_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = ConnectionHandler({"default": {}, "tuned": sqlite_database(Path(tmpdir) / "db.sqlite3", tuned=True)})
+            connection = handler["tuned"]
+            try:
+                with connection.cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                        for name in ("journal_mode", "synchronous", "busy_timeout")
+                    }
+                self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": SQLITE_BUSY_TIMEOUT * 1000})
+                self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+            finally:
+                connection.close()
+
+
+class DatabaseFromEnvTests(SimpleTestCase):
+    def test_selects_backend_from_environment(self):
+        with mock.patch.dict("os.environ", {"DB_ENGINE": "postgres", "POSTGRES_DB": "team9_test", "DB_POOL_MAX_SIZE": "4"}):
+            database = database_from_env("db.sqlite3", tuned=True)
+        self.assertEqual(database["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(database["NAME"], "team9_test")
+        self.assertEqual(database["OPTIONS"]["pool"]["max_size"], 4)
+        # プールと CONN_MAX_AGE は併用できない
+        self.assertNotIn("CONN_MAX_AGE", database)
+
+        with mock.patch.dict("os.environ", {"DB_ENGINE": "sqlite", "DB_CONN_MAX_AGE": "60"}):
+            database = database_from_env("db.sqlite3", tuned=True)
+        self.assertEqual(database["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertEqual(database["CONN_MAX_AGE"], 60)
+        # 同時書き込みのテストが動くよう、テスト DB はインメモリではなくファイル
+        self.assertEqual(database["TEST"]["NAME"], "test_db.sqlite3")
+
+        with mock.patch.dict("os.environ", {"DB_ENGINE": "mysql"}), self.assertRaises(ImproperlyConfigured):
+            database_from_env("db.sqlite3")
+
+
+BOUNDED_CACHES = {
+    "default": {"BACKEND": "apps.common.cache.CountingLocMemCache", "LOCATION": "default-test"},
+    "bounded": {
+        "BACKEND": "apps.common.cache.CountingLocMemCache",
+        "LOCATION": "bounded-test",
+        "KEY_PREFIX": "team9",
+        "OPTIONS": {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2},
+    },
+}
+
+
+class CacheNamespaceTests(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        reset_cache_stats()
+        self.feed = CacheNamespace("feed")
+
+    def test_counts_hits_and_misses_per_namespace(self):
+        self.assertIsNone(self.feed.get("a"))
+        self.feed.set("a", [1], 60)
+        self.assertEqual(self.feed.get("a"), [1])
+        self.assertEqual(self.feed.get_many(["a", "b"]), {"a": [1]})
+        CacheNamespace("other").get("a")
+
+        stats = cache_stats()
+        self.assertEqual(stats["feed"], {"hits": 2, "misses": 2, "evictions": 0, "hit_rate": 0.5})
+        self.assertEqual(stats["other"]["misses"], 1)
+        self.assertEqual(caches["default"].get("feed:a"), [1])
+
+    def test_bump_changes_only_that_scope(self):
+        self.assertEqual(self.feed.versions("user:1", "team:1"), (0, 0))
+        self.feed.bump("user:1")
+        user_version, team_version = self.feed.versions("user:1", "team:1")
+        self.assertNotEqual(user_version, 0)
+        self.assertEqual(team_version, 0)
+
+    @override_settings(CACHES=BOUNDED_CACHES)
+    def test_counts_evictions_by_namespace(self):
+        bounded = CacheNamespace("feed", alias="bounded")
+        for i in range(6):
+            bounded.set(i, i, 60)
+        self.assertGreater(cache_stats()["feed"]["evictions"], 0)
+
+
+class CacheFromEnvTests(SimpleTestCase):
+    def test_selects_backend_from_environment(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            self.assertEqual(cache_from_env("/tmp/cache")["BACKEND"], "apps.common.cache.CountingLocMemCache")
+        with mock.patch.dict("os.environ", {"CACHE_BACKEND": "file"}):
+            self.assertEqual(cache_from_env("/tmp/cache")["LOCATION"], "/tmp/cache")
+        with mock.patch.dict("os.environ", {"CACHE_BACKEND": "redis", "REDIS_URL": "redis://cache:6379/1"}):
+            cache = cache_from_env("/tmp/cache")
+        self.assertEqual(cache["LOCATION"], "redis://cache:6379/1")
+        self.assertEqual(cache["KEY_PREFIX"], "team9")
+
+        with mock.patch.dict("os.environ", {"CACHE_BACKEND": "memcached"}), self.assertRaises(ImproperlyConfigured):
+            cache_from_env("/tmp/cache")
+
+    def test_default_backend(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            self.assertEqual(cache_from_env("/tmp/cache", default="file")["LOCATION"], "/tmp/cache")
+
+    def test_cached_auth_backend_needs_a_shared_cache(self):
+        with mock.patch.dict("os.environ", {"CACHE_BACKEND": "locmem"}):
+            locmem = cache_from_env("/tmp/cache")
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_cache(locmem, [CACHED_AUTH_BACKEND], 60)
+        # キャッシュしない・別の認証バックエンドなら通す
+        require_shared_cache(locmem, [CACHED_AUTH_BACKEND], 0)
+        require_shared_cache(locmem, ["django.contrib.auth.backends.ModelBackend"], 60)
+        with mock.patch.dict("os.environ", {"CACHE_BACKEND": "file"}):
+            require_shared_cache(cache_from_env("/tmp/cache"), [CACHED_AUTH_BACKEND], 60)
+
+
+class CacheMetricsViewTests(TestCase):
+    def test_only_staff_can_read_stats(self):
+        user = UserProfiles.objects.create_user(email="a@example.com", password="pass", display_name="A")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("cache_metrics")).status_code, 302)
+
+        user.is_staff = True
+        user.save(update_fields=["is_staff"])
+        response = self.client.get(reverse("cache_metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("auth", response.json()["namespaces"])
+
+
+class ReplicaRoutingTests(TestCase):
+    """default（テスト DB）を primary、一時ファイルの SQLite をレプリカに見立てる。
+
+    同じ行を両方に入れて display_name とチケット残高だけ変え、どちらから読んだかを見分ける。
+    """
+
+    # テストランナーが DB を用意する時点ではレプリカの alias はまだないので "__all__" にしておき、
+    # setUpClass で super() の前に alias を足す（TestCase がレプリカ側もトランザクションで包む）
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        replica = sqlite_database(Path(cls.tmpdir.name) / "replica.sqlite3")
+        connections.settings["replica"] = connections.configure_settings({DEFAULT_DB_ALIAS: {}, "replica": replica})["replica"]
+        call_command("migrate", database="replica", verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="primary", team=team,
+        )
+        grant_initial_tickets(self.user)
+        # レプリカへの複製の代わり（残高は遅れている）
+        team.save(using="replica", force_insert=True)
+        self.user.display_name = "replica"
+        self.user.save(using="replica", force_insert=True)
+        TicketBalance.objects.using("replica").create(
+            owner_type=TicketTransaction.OwnerType.USER, user_id=self.user.pk, balance=0,
+        )
+        self.client.force_login(UserProfiles.objects.get(pk=self.user.pk))
+
+    def _me(self):
+        return self.client.get(reverse("me")).json()
+
+    def test_opted_in_views_read_from_replica_until_the_user_writes(self):
+        self.assertEqual(self._me()["balances"]["user_tickets"], 0)
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        response = self.client.post(reverse("reservation_new"), {"date": tomorrow.isoformat(), "time": "10:00"})
+        self.assertIn("primary_until", response.cookies)
+
+        # 書き込んだ直後は primary を読む（預けた1枚が引かれている）
+        self.assertEqual(self._me()["balances"]["user_tickets"], INITIAL_TICKETS - 1)
+
+        self.client.cookies.pop("primary_until")
+        self.assertEqual(self._me()["balances"]["user_tickets"], 0)
+
+    def test_authenticated_user_is_read_from_primary(self):
+        # ログイン中のユーザーは @login_required がレプリカに向ける前に読む
+        with override_settings(AUTH_USER_CACHE_TTL=0):
+            self.assertEqual(self._me()["display_name"], "primary")
+
+    def test_router_uses_primary_outside_opted_in_views(self):
+        self.assertEqual(router.db_for_read(UserProfiles), DEFAULT_DB_ALIAS)
+
+        @read_from_replica
+        def view(request):
+            return router.db_for_read(UserProfiles), router.db_for_read(Session), router.db_for_write(UserProfiles)
+
+        request = RequestFactory().get("/")
+        self.assertEqual(view(request), ("replica", DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS))
+
+
+class RequestMetricsTests(TestCase):
+    def test_sets_server_timing_and_logs_view(self):
+        user = UserProfiles.objects.create_user(email="a@example.com", password="pass", display_name="A")
+        self.client.force_login(user)
+
+        with self.assertLogs("apps.request_metrics", "INFO") as logs:
+            response = self.client.get("/auth/me/")
+
+        self.assertIn("db;dur=", response["Server-Timing"])
+        self.assertIn("view=me", logs.output[0])
+
+    async def test_counts_queries_of_async_views(self):
+        user = await UserProfiles.objects.acreate(email="a@example.com", display_name="A")
+        await self.async_client.aforce_login(user)
+
+        with self.assertLogs("apps.request_metrics", "INFO") as logs:
+            response = await self.async_client.get("/auth/me/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("view=me", logs.output[0])
+        self.assertNotIn("db_queries=0", logs.output[0])
+
+    def test_request_lines_are_quiet_by_default(self):
+        # テストや開発のサーバーの出力を1リクエスト1行で埋めない（N+1 の警告は出す）
+        logger = logging.getLogger("apps.request_metrics")
+        self.assertFalse(logger.isEnabledFor(logging.INFO))
+        self.assertTrue(logger.isEnabledFor(logging.WARNING))
+
+    def test_repeated_shapes_are_reported(self):
+        recorder = QueryRecorder()
+        for n in range(3):
+            recorder(lambda *args: None, "SELECT * FROM t WHERE id IN (%s, %s)", [n, n], False, {})
+        recorder(lambda *args: None, "SELECT * FROM t WHERE id IN (%s)", [1], False, {})
+
+        self.assertEqual(recorder.repeated(4), [("SELECT * FROM t WHERE id IN (...)", 4)])
+        self.assertEqual(query_shape("SELECT  1\n FROM t"), "SELECT 1 FROM t")
+
+
+class SeedLoadTests(TestCase):
+    def test_timestamps_are_not_in_the_future(self):
+        call_command("seed_load", teams=2, days=3, seed=1, stdout=StringIO())
+        now = timezone.now()
+
+        self.assertTrue(Reservation.objects.filter(start_at__gt=now).exists())
+        self.assertFalse(Reservation.objects.filter(created_at__gt=now).exists())
+        self.assertFalse(Reservation.objects.filter(completed_at__gt=now).exists())
+        # コマンドが終われば auto_now は元に戻っている
+        self.assertTrue(Reservation._meta.get_field("updated_at").auto_now)
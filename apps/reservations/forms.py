@@ -3,6 +3,7 @@ from django import forms
 from django.utils import timezone
 
 from .models import Reservation
+from .services import MAX_RESERVATIONS_PER_DAY, reservations_near, reservations_on_day
 
 
 class ReservationForm(forms.ModelForm):
@@ -51,24 +52,13 @@ class ReservationForm(forms.ModelForm):
             raise forms.ValidationError("現在より前の時刻で予約を入れることはできません。")
 
         # 1日2枠まで
-        day = timezone.localdate(start_at)
-        day_count = Reservation.objects.filter(
-            user=user,
-            start_at__date=day,
-        ).count()
+        day_count = reservations_on_day(user, timezone.localdate(start_at)).count()
 
-        if day_count >= 2:
+        if day_count >= MAX_RESERVATIONS_PER_DAY:
             raise forms.ValidationError("予約は1日2枠までです。")
 
         # 前後3時間空ける
-        lower = start_at - timedelta(hours=3)
-        upper = start_at + timedelta(hours=3)
-
-        conflict_exists = Reservation.objects.filter(
-            user=user,
-            start_at__gt=lower,
-            start_at__lt=upper,
-        ).exists()
+        conflict_exists = reservations_near(user, start_at).exists()
 
         if conflict_exists:
             raise forms.ValidationError("予約は前後3時間以上空けてください。")
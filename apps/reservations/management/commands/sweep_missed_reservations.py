@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.reservations.services import sweep_missed_reservations
+
+
+class Command(BaseCommand):
+    help = "期限切れの予約を missed にして、チームプールへの回収を記録する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="常駐して --interval 秒ごとに実行する",
+        )
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            stats = sweep_missed_reservations(batch_size=options["batch_size"])
+            rate = stats["marked"] / stats["elapsed"] if stats["elapsed"] else 0
+            self.stdout.write(
+                f"marked={stats['marked']} ledger_created={stats['ledger_created']} "
+                f"batches={stats['batches']} elapsed={stats['elapsed']:.3f}s rate={rate:.0f}/s"
+            )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -43,5 +43,19 @@ class Reservation(models.Model):
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
 
+  class Meta:
+    indexes = [
+      # ダッシュボード・予約フォーム（1日2枠 / 前後3時間）・マイページの週次集計
+      models.Index(fields=["user", "start_at"], name="reservation_user_start_idx"),
+      # ユーザー単位の期限切れチェック・マイページのリカバリ対象（missed, used_recovery）
+      models.Index(fields=["user", "status", "start_at"], name="reservation_user_status_idx"),
+      # スイーパー：全ユーザーの scheduled を開始時刻順に拾う
+      models.Index(
+        fields=["start_at"],
+        condition=models.Q(status="scheduled"),
+        name="reservation_scheduled_idx",
+      ),
+    ]
+
   def __str__(self):
     return f"{self.user} - {self.start_at}"
\ No newline at end of file
@@ -0,0 +1,446 @@
+import asyncio
+import hashlib
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import Reservation
+from apps.accounts.models import UserProfiles
+from apps.accounts.services import (
+    aget_user_team,
+    apply_daily_activity,
+    create_completion_rewards,
+    create_fail_to_team_pool_bulk,
+    create_recovery,
+)
+from apps.common.async_utils import alist
+from apps.common.cache import CacheNamespace
+from apps.common.dates import local_day_range, local_day_start
+from apps.timeline.events import publish_team_event
+from apps.timeline.models import TimelinePost, Like
+from apps.timeline.services import serialize_post
+
+
+# 開始10分前から30分後までチェックインできる
+CHECKIN_OPENS_BEFORE = timedelta(minutes=10)
+# 開始から30分過ぎても未チェックインなら未達成
+MISSED_AFTER = timedelta(minutes=30)
+# 1日に入れられる予約の数と、予約同士の間隔
+MAX_RESERVATIONS_PER_DAY = 2
+RESERVATION_GAP = timedelta(hours=3)
+
+# ダッシュボードのキャッシュ寿命（秒）。表示が切り替わる時刻が先に来ればそこまで
+DASHBOARD_CACHE_TTL = 300
+
+
+def overdue_reservations(now=None):
+    now = now or timezone.now()
+    return Reservation.objects.filter(
+        status="scheduled",
+        completed_at__isnull=True,
+        start_at__lt=now - MISSED_AFTER,
+    )
+
+
+def sweep_missed_reservations(now=None, batch_size=500, user=None):
+    """期限切れの予約をまとめて missed にし、チームプールへの回収を記録する。
+
+    全ユーザー分を batch_size 件ずつ UPDATE + bulk INSERT で処理する。
+    user を渡すとそのユーザー分だけを処理する。
+    """
+    now = now or timezone.now()
+    qs = overdue_reservations(now)
+    if user is not None:
+        qs = qs.filter(user=user)
+
+    stats = {"batches": 0, "marked": 0, "ledger_created": 0}
+    started = time.monotonic()
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                qs.select_for_update(of=("self",))
+                .order_by("id")
+                .values_list("id", "user_id", "user__team_id", "start_at")[:batch_size]
+            )
+            if not rows:
+                break
+
+            stats["batches"] += 1
+            stats["marked"] += Reservation.objects.filter(
+                id__in=[reservation_id for reservation_id, _, _, _ in rows],
+            ).update(status="missed", updated_at=now)
+
+            # 回収先は現在の所属チーム（チームなしは回収しない）
+            stats["ledger_created"] += create_fail_to_team_pool_bulk(
+                [(team_id, reservation_id) for reservation_id, _, team_id, _ in rows if team_id]
+            )
+
+            # 日次アクティビティはユーザー・日ごとに1回だけ加算する
+            misses = Counter((user_id, timezone.localdate(start_at)) for _, user_id, _, start_at in rows)
+            for (user_id, day), count in misses.items():
+                apply_daily_activity(user_id, day, misses=count)
+
+            # UPDATE はシグナルが飛ばないので、ここでキャッシュを捨てる
+            for user_id in {user_id for _, user_id, _, _ in rows}:
+                invalidate_dashboard(user_id=user_id)
+
+    stats["elapsed"] = time.monotonic() - started
+    return stats
+
+
+# =========================
+# 完了処理
+# =========================
+
+@dataclass
+class CompletionResult:
+    COMPLETED = "completed"
+    ALREADY_COMPLETED = "already_completed"
+    NEED_CHECKIN = "need_checkin"
+
+    reservation: Reservation
+    status: str
+    rewards: list = field(default_factory=list)
+    post: TimelinePost | None = None
+
+    @property
+    def completed(self):
+        return self.status == self.COMPLETED
+
+
+def create_timeline_post_if_needed(reservation):
+    """完了した予約の投稿を作る（既にあればそれを返す）。
+
+    reservation.timeline_post を select_related 済みなら存在チェックにクエリは出ない。
+    """
+    if hasattr(reservation, "timeline_post"):
+        return reservation.timeline_post
+
+    team_id = reservation.user.team_id
+    if team_id is None:
+        return None
+
+    if reservation.team_id != team_id:
+        reservation.team_id = team_id
+        reservation.save(update_fields=["team", "updated_at"])
+
+    visibility = "with_detail" if reservation.share_detail else "summary_only"
+
+    post = TimelinePost.objects.create(
+        user=reservation.user,
+        team_id=team_id,
+        reservation=reservation,
+        visibility=visibility,
+    )
+    publish_team_event(team_id, "post", serialize_post(post))
+    return post
+
+
+def record_completion(user, reservation_id, activity_type, memo="", share_detail=False, now=None):
+    """予約の完了・チケットの返却とボーナス・タイムライン投稿を1トランザクションで行う。
+
+    予約行をロックしてから状態を見るので、二重送信しても2回目は ALREADY_COMPLETED になる。
+    ユーザーの予約でなければ Reservation.DoesNotExist を送出する。
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        reservation = (
+            Reservation.objects
+            .select_for_update(of=("self",))
+            .select_related("timeline_post")
+            .get(id=reservation_id, user=user)
+        )
+        # 投稿作成で user を引き直さないように
+        reservation.user = user
+
+        if reservation.status == "completed" or reservation.completed_at is not None:
+            return CompletionResult(reservation, CompletionResult.ALREADY_COMPLETED)
+        if reservation.checkin_at is None:
+            return CompletionResult(reservation, CompletionResult.NEED_CHECKIN)
+
+        reservation.activity_type = activity_type
+        reservation.memo = memo
+        reservation.share_detail = share_detail
+        reservation.status = "completed"
+        reservation.completed_at = now
+        update_fields = ["activity_type", "memo", "share_detail", "status", "completed_at", "updated_at"]
+        # 投稿と同じく現在の所属チームに付け替える（ここで一緒に保存する）
+        if user.team_id is not None and reservation.team_id != user.team_id:
+            reservation.team_id = user.team_id
+            update_fields.append("team")
+        reservation.save(update_fields=update_fields)
+        apply_daily_activity(user.id, timezone.localdate(reservation.start_at), completions=1)
+
+        rewards = create_completion_rewards(user, reservation.id)
+        post = create_timeline_post_if_needed(reservation)
+
+    return CompletionResult(reservation, CompletionResult.COMPLETED, rewards, post)
+
+
+# =========================
+# リカバリー
+# =========================
+
+class RecoveryResult:
+    RECOVERED = "recovered"
+    NOT_AVAILABLE = "not_available"
+    NO_TEAM = "no_team"
+    COOLDOWN = "cooldown"
+
+
+def recover_reservation(user, reservation_id, now=None):
+    """未達成の予約にリカバリーを使う（チームのプールから1枚戻す。週1回まで）。
+
+    予約行とユーザー行をロックしてから状態とクールダウンを見るので、二重送信しても2回目は
+    NOT_AVAILABLE / COOLDOWN になり、日次アクティビティの集計も1回だけ動く。
+    ユーザーの予約でなければ Reservation.DoesNotExist を送出する。
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        reservation = Reservation.objects.select_for_update().get(id=reservation_id, user=user)
+        if reservation.status != "missed" or reservation.used_recovery:
+            return RecoveryResult.NOT_AVAILABLE
+
+        locked_user = UserProfiles.objects.select_for_update().get(pk=user.pk)
+        if locked_user.team_id is None:
+            return RecoveryResult.NO_TEAM
+        if not recovery_available_for(locked_user, timezone.localdate(now)):
+            return RecoveryResult.COOLDOWN
+
+        reservation.status = "recovery"
+        reservation.used_recovery = True
+        reservation.save(update_fields=["status", "used_recovery", "updated_at"])
+        apply_daily_activity(user.pk, timezone.localdate(reservation.start_at), misses=-1, recoveries=1)
+
+        create_recovery(locked_user, locked_user.team_id, ref_id=reservation.id)
+
+        locked_user.last_recovery_at = now
+        locked_user.save(update_fields=["last_recovery_at"])
+        user.last_recovery_at = now
+
+    return RecoveryResult.RECOVERED
+
+
+# =========================
+# ダッシュボード（読み取り専用）
+# =========================
+
+dashboard_cache = CacheNamespace("dashboard")
+
+
+def invalidate_dashboard(user_id=None, team_id=None):
+    """ユーザー単位・チーム単位のバージョンを進めて、古いキャッシュを使わせない。"""
+    scopes = []
+    if user_id is not None:
+        scopes.append(f"user:{user_id}")
+    if team_id is not None:
+        scopes.append(f"team:{team_id}")
+    dashboard_cache.bump(*scopes)
+
+
+def _dashboard_scopes(user):
+    return f"user:{user.pk}", f"team:{user.team_id}"
+
+
+def _dashboard_cache_key(user, versions):
+    user_version, team_version = versions
+    return f"{user.pk}:{user_version}:{user.team_id}:{team_version}"
+
+
+def _seconds_until_next_change(reservations, now):
+    """can_checkin / missed / 今日 の判定が変わる一番近い時刻までの秒数。"""
+    _, next_midnight = local_day_range(timezone.localdate(now))
+    boundaries = [next_midnight]
+    for r in reservations:
+        boundaries += [r.start_at - CHECKIN_OPENS_BEFORE, r.start_at + MISSED_AFTER]
+    upcoming = [b for b in boundaries if b > now]
+    return (min(upcoming) - now).total_seconds()
+
+
+def recovery_available_for(user, today):
+    """チームに所属していて、今週まだリカバリーを使っていなければ True。"""
+    start_of_week = today - timedelta(days=today.weekday())
+    last = user.last_recovery_at
+    cooldown_ok = not (last and timezone.localdate(last) >= start_of_week)
+    return user.team_id is not None and cooldown_ok
+
+
+def reservation_flags(r, now, today, recovery_available):
+    """ダッシュボードと API で共通の、予約ごとの表示フラグ。"""
+    is_missed = r.status == "missed"
+    if r.status == "scheduled" and r.start_at + MISSED_AFTER < now:
+        is_missed = True
+    checkin_open = (r.start_at - CHECKIN_OPENS_BEFORE) <= now <= (r.start_at + MISSED_AFTER)
+
+    return {
+        "is_today": timezone.localtime(r.start_at).date() == today,
+        "completed": (r.status == "completed") or (r.completed_at is not None),
+        "checked_in": r.checkin_at is not None,
+        "can_checkin": checkin_open and (r.checkin_at is None),
+        "missed": is_missed,
+        "recovery": r.status == "recovery",
+        "recovery_available": recovery_available,
+    }
+
+
+def upcoming_reservations(user, today):
+    """今日以降の予約（今日の終わった枠も未達成表示のために含める）。"""
+    return Reservation.objects.filter(user=user, start_at__gte=local_day_start(today))
+
+
+def reservations_on_day(user, day):
+    """その日（ローカル日付）の予約。1日の枠数の制限に使う。"""
+    day_start, day_end = local_day_range(day)
+    return Reservation.objects.filter(user=user, start_at__gte=day_start, start_at__lt=day_end)
+
+
+def reservations_near(user, start_at, gap=RESERVATION_GAP):
+    """start_at の前後 gap 未満にある予約。"""
+    return Reservation.objects.filter(user=user, start_at__gt=start_at - gap, start_at__lt=start_at + gap)
+
+
+def recent_reservations(user, limit=5):
+    return Reservation.objects.filter(user=user).order_by("-start_at")[:limit]
+
+
+def unrecovered_misses(user):
+    """リカバリーをまだ使っていない未達成の予約（新しい順）。"""
+    return Reservation.objects.filter(user=user, status="missed", used_recovery=False).order_by("-start_at")
+
+
+def _dashboard_querysets(user, team_id, today):
+    reservations = upcoming_reservations(user, today).order_by("start_at")
+    posts = (
+        TimelinePost.objects
+        .filter(team_id=team_id)
+        .select_related("reservation", "user")
+        .order_by("-created_at")[:20]
+    )
+    liked_post_ids = Like.objects.filter(user=user, post__team_id=team_id).values_list("post_id", flat=True)
+    return reservations, posts, liked_post_ids
+
+
+def _assemble_dashboard(user, team, reservations, timeline_posts, liked_post_ids, now, today):
+    recovery_available = recovery_available_for(user, today)
+    reservation_items = [
+        {"reservation": r, **reservation_flags(r, now, today, recovery_available)}
+        for r in reservations
+    ]
+    context = {
+        "reservation_items": reservation_items,
+        "timeline_posts": timeline_posts,
+        "team": team,
+        "liked_post_ids": set(liked_post_ids),
+        "today": today,
+    }
+    return context, _seconds_until_next_change(reservations, now)
+
+
+def build_dashboard_context(user, now=None):
+    """ダッシュボードの表示内容を組み立てる（チーム取得を含めて最大4クエリ）。"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    team = user.team
+
+    reservations, posts, liked_post_ids = _dashboard_querysets(user, user.team_id, today)
+    reservations = list(reservations)
+    if team:
+        posts, liked_post_ids = list(posts), list(liked_post_ids)
+    else:
+        posts, liked_post_ids = [], []
+
+    return _assemble_dashboard(user, team, reservations, posts, liked_post_ids, now, today)
+
+
+async def abuild_dashboard_context(user, now=None):
+    """build_dashboard_context の async 版。4クエリを asyncio.gather でまとめて待つ。"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    reservations, posts, liked_post_ids = _dashboard_querysets(user, user.team_id, today)
+    if user.team_id is None:
+        team, posts, liked_post_ids = None, [], []
+        reservations = await alist(reservations)
+    else:
+        team, reservations, posts, liked_post_ids = await asyncio.gather(
+            aget_user_team(user),
+            alist(reservations),
+            alist(posts),
+            alist(liked_post_ids),
+        )
+
+    return _assemble_dashboard(user, team, reservations, posts, liked_post_ids, now, today)
+
+
+def _dashboard_ttl(ttl):
+    return max(1, min(DASHBOARD_CACHE_TTL, int(ttl)))
+
+
+def get_dashboard_context(user):
+    key = _dashboard_cache_key(user, dashboard_cache.versions(*_dashboard_scopes(user)))
+    context = dashboard_cache.get(key)
+    if context is None:
+        context, ttl = build_dashboard_context(user)
+        dashboard_cache.set(key, context, _dashboard_ttl(ttl))
+    return context
+
+
+async def aget_dashboard_context(user):
+    key = _dashboard_cache_key(user, await dashboard_cache.aversions(*_dashboard_scopes(user)))
+    context = await dashboard_cache.aget(key)
+    if context is None:
+        context, ttl = await abuild_dashboard_context(user)
+        await dashboard_cache.aset(key, context, _dashboard_ttl(ttl))
+    return context
+
+
+# =========================
+# 予約一覧 API（読み取り専用）
+# =========================
+
+def reservation_list_etag(user, now=None):
+    """予約一覧 API の ETag を1回の集計クエリで作る。
+
+    行の変更は件数と max(updated_at) で、時刻だけで変わるフラグ（can_checkin / missed）は
+    「チェックイン受付が始まった件数」「期限を過ぎた件数」で表す。
+    日付・リカバリー状況も含めるので、一覧の中身が変わらない限り同じ値になる。
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    summary = upcoming_reservations(user, today).aggregate(
+        count=Count("id"),
+        last_updated=Max("updated_at"),
+        opened=Count("id", filter=Q(start_at__lte=now + CHECKIN_OPENS_BEFORE)),
+        overdue=Count("id", filter=Q(start_at__lt=now - MISSED_AFTER)),
+    )
+    last_updated = summary["last_updated"]
+    parts = [
+        today.isoformat(),
+        summary["count"],
+        last_updated.isoformat() if last_updated else "",
+        summary["opened"],
+        summary["overdue"],
+        recovery_available_for(user, today),
+    ]
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def serialize_reservation_list(user, now=None):
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    recovery_available = recovery_available_for(user, today)
+    return [
+        {
+            "id": r.id,
+            "start_at": r.start_at.isoformat(),
+            "status": r.status,
+            **reservation_flags(r, now, today, recovery_available),
+        }
+        for r in upcoming_reservations(user, today).order_by("start_at")
+    ]
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Reservation
+from .services import invalidate_dashboard
+from apps.timeline.models import TimelinePost, Like
+
+
+# ダッシュボードに出るデータが変わったらキャッシュを捨てる
+
+@receiver([post_save, post_delete], sender=Reservation)
+def reservation_changed(sender, instance, **kwargs):
+    invalidate_dashboard(user_id=instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=TimelinePost)
+def timeline_post_changed(sender, instance, **kwargs):
+    invalidate_dashboard(team_id=instance.team_id)
+
+
+@receiver([post_save, post_delete], sender=Like)
+def like_changed(sender, instance, **kwargs):
+    team_id = (
+        TimelinePost.objects
+        .filter(pk=instance.post_id)
+        .values_list("team_id", flat=True)
+        .first()
+    )
+    invalidate_dashboard(user_id=instance.user_id, team_id=team_id)
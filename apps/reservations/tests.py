@@ -1,3 +1,382 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-# Create your tests here.
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Reservation
+from .services import (
+    CompletionResult,
+    RecoveryResult,
+    abuild_dashboard_context,
+    build_dashboard_context,
+    get_dashboard_context,
+    _dashboard_querysets,
+    overdue_reservations,
+    recent_reservations,
+    record_completion,
+    recover_reservation,
+    reservation_list_etag,
+    reservations_near,
+    reservations_on_day,
+    sweep_missed_reservations,
+    unrecovered_misses,
+    upcoming_reservations,
+)
+from apps.accounts.models import Teams, UserProfiles, TicketTransaction, TicketSource, UserDailyActivity
+from apps.accounts.services import get_team_pool_balance, get_user_ticket_balance, grant_initial_tickets
+from apps.common.cache import cache_stats, reset_cache_stats
+from apps.timeline.models import TimelinePost, Like
+
+
+class SweepMissedReservationsTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        self.loner = UserProfiles.objects.create_user(
+            email="b@example.com", password="pass", display_name="B",
+        )
+
+    def _reserve(self, user, start_at, **kwargs):
+        return Reservation.objects.create(user=user, team=user.team, start_at=start_at, **kwargs)
+
+    def test_marks_overdue_rows_and_collects_to_team_pool(self):
+        now = timezone.now()
+        overdue = self._reserve(self.user, now - timedelta(hours=2))
+        loner_overdue = self._reserve(self.loner, now - timedelta(hours=2))
+        upcoming = self._reserve(self.user, now + timedelta(hours=2))
+        done = self._reserve(self.user, now - timedelta(hours=5), status="completed", completed_at=now)
+
+        stats = sweep_missed_reservations(now=now, batch_size=1)
+
+        self.assertEqual(stats["marked"], 2)
+        self.assertEqual(stats["ledger_created"], 1)
+        statuses = dict(Reservation.objects.values_list("id", "status"))
+        self.assertEqual(statuses[overdue.id], "missed")
+        self.assertEqual(statuses[loner_overdue.id], "missed")
+        self.assertEqual(statuses[upcoming.id], "scheduled")
+        self.assertEqual(statuses[done.id], "completed")
+        self.assertEqual(get_team_pool_balance(self.team), 1)
+
+    def test_is_idempotent(self):
+        now = timezone.now()
+        self._reserve(self.user, now - timedelta(hours=2))
+
+        sweep_missed_reservations(now=now)
+        stats = sweep_missed_reservations(now=now)
+
+        self.assertEqual(stats["marked"], 0)
+        self.assertEqual(TicketTransaction.objects.filter(team=self.team).count(), 1)
+        self.assertEqual(get_team_pool_balance(self.team), 1)
+
+
+class RecordCompletionTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        grant_initial_tickets(self.user)
+        now = timezone.now()
+        self.reservation = Reservation.objects.create(
+            user=self.user, start_at=now - timedelta(minutes=5), checkin_at=now,
+        )
+
+    def test_completes_in_one_transaction_with_fixed_queries(self):
+        # SAVEPOINT・予約ロック・UPDATE・日次アクティビティ・
+        # 台帳（SAVEPOINT・既存チェック・INSERT・残高・日次アクティビティ・RELEASE）・投稿 INSERT・RELEASE
+        with self.assertNumQueries(12):
+            result = record_completion(self.user, self.reservation.id, "run", memo="ok", share_detail=True)
+
+        self.assertTrue(result.completed)
+        self.assertEqual(len(result.rewards), 2)
+        self.assertEqual(result.post.visibility, "with_detail")
+        reservation = Reservation.objects.get(pk=self.reservation.pk)
+        self.assertEqual(reservation.status, "completed")
+        self.assertEqual(reservation.team_id, self.team.id)
+        self.assertEqual(get_user_ticket_balance(self.user), 9)
+
+    def test_double_submit_is_a_no_op(self):
+        record_completion(self.user, self.reservation.id, "run")
+
+        # SAVEPOINT・予約ロック・RELEASE
+        with self.assertNumQueries(3):
+            result = record_completion(self.user, self.reservation.id, "walk")
+
+        self.assertEqual(result.status, CompletionResult.ALREADY_COMPLETED)
+        self.assertEqual(TimelinePost.objects.count(), 1)
+        self.assertEqual(get_user_ticket_balance(self.user), 9)
+        self.assertEqual(Reservation.objects.get(pk=self.reservation.pk).activity_type, "run")
+
+    def test_requires_checkin_and_ownership(self):
+        Reservation.objects.filter(pk=self.reservation.pk).update(checkin_at=None)
+        result = record_completion(self.user, self.reservation.id, "run")
+        self.assertEqual(result.status, CompletionResult.NEED_CHECKIN)
+        self.assertFalse(TimelinePost.objects.exists())
+
+        other = UserProfiles.objects.create_user(email="b@example.com", password="pass", display_name="B")
+        with self.assertRaises(Reservation.DoesNotExist):
+            record_completion(other, self.reservation.id, "run")
+
+
+class RecoverReservationTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        grant_initial_tickets(self.user)
+        self.reservation = Reservation.objects.create(
+            user=self.user, team=self.team, start_at=timezone.now() - timedelta(hours=2),
+        )
+        sweep_missed_reservations()
+
+    def _activity(self):
+        # 予約が日付をまたいでもよいように、ユーザーの全日分を足す
+        return UserDailyActivity.objects.filter(user=self.user).aggregate(
+            misses=Sum("misses"), recoveries=Sum("recoveries"),
+        )
+
+    def test_double_submit_is_a_no_op(self):
+        self.assertEqual(recover_reservation(self.user, self.reservation.id), RecoveryResult.RECOVERED)
+        # 古い user（last_recovery_at が未設定のまま）で送り直してもロックした行で判定する
+        stale = UserProfiles.objects.get(pk=self.user.pk)
+        stale.last_recovery_at = None
+        self.assertEqual(recover_reservation(stale, self.reservation.id), RecoveryResult.NOT_AVAILABLE)
+
+        self.assertEqual(self._activity(), {"misses": 0, "recoveries": 1})
+        self.assertEqual(Reservation.objects.get(pk=self.reservation.pk).status, "recovery")
+        self.assertEqual(get_user_ticket_balance(self.user), 8)
+        self.assertEqual(get_team_pool_balance(self.team), 0)
+
+    def test_weekly_cooldown_is_checked_on_the_locked_user(self):
+        other = Reservation.objects.create(
+            user=self.user, team=self.team, start_at=timezone.now() - timedelta(hours=3),
+        )
+        sweep_missed_reservations()
+        recover_reservation(self.user, self.reservation.id)
+
+        stale = UserProfiles.objects.get(pk=self.user.pk)
+        stale.last_recovery_at = None
+        self.assertEqual(recover_reservation(stale, other.id), RecoveryResult.COOLDOWN)
+        self.assertEqual(Reservation.objects.get(pk=other.pk).status, "missed")
+        self.assertEqual(self._activity(), {"misses": 1, "recoveries": 1})
+
+    def test_view_redirects_with_error_on_cooldown(self):
+        UserProfiles.objects.filter(pk=self.user.pk).update(last_recovery_at=timezone.now())
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("reservation_recovery", args=[self.reservation.id]))
+        self.assertEqual(response["Location"], "/?error=recovery_cooldown")
+
+
+class DashboardContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        self.mate = UserProfiles.objects.create_user(
+            email="b@example.com", password="pass", display_name="B", team=self.team,
+        )
+        now = timezone.now()
+        for hours in (1, 5, 26):
+            Reservation.objects.create(user=self.user, team=self.team, start_at=now + timedelta(hours=hours))
+        for i in range(3):
+            done = Reservation.objects.create(
+                user=self.mate, team=self.team, start_at=now - timedelta(days=i + 1),
+                status="completed", completed_at=now,
+            )
+            post = TimelinePost.objects.create(user=self.mate, team=self.team, reservation=done)
+            Like.objects.create(user=self.user, post=post)
+
+    def _fresh_user(self):
+        return UserProfiles.objects.get(pk=self.user.pk)
+
+    def test_builds_with_fixed_query_count(self):
+        user = self._fresh_user()
+        # team, reservations, posts, liked ids
+        with self.assertNumQueries(4):
+            context, _ = build_dashboard_context(user)
+            self.assertEqual(len(context["reservation_items"]), 3)
+            self.assertEqual(len(context["timeline_posts"]), 3)
+            self.assertEqual([p.user.display_name for p in context["timeline_posts"]], ["B"] * 3)
+            self.assertEqual(len(context["liked_post_ids"]), 3)
+
+    async def test_async_build_matches_sync(self):
+        user = await UserProfiles.objects.aget(pk=self.user.pk)
+        now = timezone.now()
+
+        context, ttl = await abuild_dashboard_context(user, now=now)
+        expected, expected_ttl = await sync_to_async(build_dashboard_context)(
+            await UserProfiles.objects.select_related("team").aget(pk=self.user.pk), now=now,
+        )
+
+        self.assertEqual(context, expected)
+        self.assertEqual(ttl, expected_ttl)
+
+    def test_second_read_hits_cache(self):
+        reset_cache_stats()
+        get_dashboard_context(self._fresh_user())
+        with self.assertNumQueries(0):
+            get_dashboard_context(self.user)
+        self.assertEqual(cache_stats()["dashboard"]["hits"], 1)
+
+    def test_writes_invalidate_cache(self):
+        get_dashboard_context(self._fresh_user())
+
+        Like.objects.filter(user=self.user).first().delete()
+
+        context = get_dashboard_context(self._fresh_user())
+        self.assertEqual(len(context["liked_post_ids"]), 2)
+
+        Reservation.objects.create(user=self.user, team=self.team, start_at=timezone.now() + timedelta(hours=10))
+
+        context = get_dashboard_context(self._fresh_user())
+        self.assertEqual(len(context["reservation_items"]), 4)
+
+
+class ReservationListApiTests(TestCase):
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("reservation_list_api")
+        now = timezone.now()
+        self.soon = Reservation.objects.create(user=self.user, team=self.team, start_at=now + timedelta(minutes=5))
+        Reservation.objects.create(user=self.user, team=self.team, start_at=now + timedelta(hours=5))
+
+    def test_returns_flags_and_etag(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"])
+        items = response.json()["reservations"]
+        self.assertEqual([item["id"] for item in items][0], self.soon.id)
+        self.assertTrue(items[0]["can_checkin"])
+        self.assertFalse(items[1]["can_checkin"])
+        self.assertTrue(items[0]["recovery_available"])
+
+    def test_matching_etag_returns_304_without_listing(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        # セッション・ETag 用の集計（ユーザーは認証バックエンドのキャッシュから読む）
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_etag_changes_with_rows_and_time(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.soon.checkin_at = timezone.now()
+        self.soon.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+        # 行が変わらなくても、時間が進んで missed になれば別の ETag
+        self.assertNotEqual(
+            reservation_list_etag(self.user, now=timezone.now() + timedelta(hours=1)),
+            reservation_list_etag(self.user),
+        )
+
+
+class ConcurrentWriteTests(TransactionTestCase):
+    """行ロックで直列化している書き込みが、同時に走っても1回分しか記録されないことを確認する。
+
+    SQLite と PostgreSQL（DB_ENGINE=postgres）の両方で同じ結果になること。
+    """
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite uses table locks without a busy timeout; needs a file-backed test database")
+        self.team = Teams.objects.create(name="Team-0001")
+        self.user = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        grant_initial_tickets(self.user)
+
+    def _in_thread(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+
+    def test_parallel_completion_is_recorded_once(self):
+        now = timezone.now()
+        reservation = Reservation.objects.create(user=self.user, start_at=now - timedelta(minutes=5), checkin_at=now)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda _: self._in_thread(record_completion, self.user, reservation.id, "run"), range(8),
+            ))
+
+        self.assertEqual(sum(r.completed for r in results), 1)
+        self.assertEqual(TimelinePost.objects.filter(reservation=reservation).count(), 1)
+        self.assertEqual(get_user_ticket_balance(self.user), 9)
+
+    def test_parallel_sweeps_collect_each_reservation_once(self):
+        now = timezone.now()
+        Reservation.objects.bulk_create([
+            Reservation(user=self.user, start_at=now - timedelta(hours=2, minutes=n)) for n in range(20)
+        ])
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            stats = list(pool.map(
+                lambda _: self._in_thread(sweep_missed_reservations, now, 5), range(4),
+            ))
+
+        self.assertEqual(sum(s["marked"] for s in stats), 20)
+        self.assertEqual(
+            TicketTransaction.objects.filter(team=self.team, source=TicketSource.FAIL_TO_TEAM_POOL).count(), 20,
+        )
+        self.assertEqual(get_team_pool_balance(self.team), 20)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+class ReservationQueryPlanTests(TestCase):
+    """ホットパスのクエリがテーブルのフルスキャンにならないことを確認する。"""
+
+    def assertUsesIndex(self, qs, index):
+        """予約テーブルを読む行がすべて index での SEARCH であること（SCAN は索引のフルスキャンも含めて不可）。"""
+        plan = qs.explain()
+        lines = [line for line in plan.splitlines() if "reservations_reservation" in line]
+        self.assertTrue(lines, plan)
+        for line in lines:
+            self.assertRegex(line, rf"SEARCH reservations_reservation USING (COVERING )?INDEX {index}\b", plan)
+        self.assertNotIn("SCAN", plan)
+
+    def test_hot_paths_use_indexes(self):
+        # 本番のコードが組み立てるクエリそのものの実行計画を見る
+        now = timezone.now()
+        today = timezone.localdate()
+        user = UserProfiles(pk=1)
+        querysets = {
+            # sweep_missed_reservations（全ユーザー / ユーザー単位）
+            "sweep": (overdue_reservations(now), "reservation_scheduled_idx"),
+            "sweep_user": (overdue_reservations(now).filter(user=user), "reservation_user_status_idx"),
+            # build_dashboard_context / reservation_list_api
+            "dashboard": (_dashboard_querysets(user, 1, today)[0], "reservation_user_start_idx"),
+            "upcoming": (upcoming_reservations(user, today), "reservation_user_start_idx"),
+            # ReservationForm.clean
+            "form_day_count": (reservations_on_day(user, today), "reservation_user_start_idx"),
+            "form_conflict": (reservations_near(user, now), "reservation_user_start_idx"),
+            # mypage
+            "mypage_recent": (recent_reservations(user), "reservation_user_start_idx"),
+            "mypage_missed": (unrecovered_misses(user), "reservation_user_status_idx"),
+        }
+        for name, (qs, index) in querysets.items():
+            with self.subTest(name):
+                self.assertUsesIndex(qs, index)
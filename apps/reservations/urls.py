@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+  path("api/", views.reservation_list_api, name="reservation_list_api"),#一覧（JSON・ポーリング用）
   path("new/", views.new_reservation, name="reservation_new"),#予約画面へ
   path("<int:reservation_id>/checkin/", views.checkin_reservation, name="reservation_checkin"),#チェックイン
   path("<int:reservation_id>/action/", views.action_reservation, name="reservation_action"),#タイマー、運動中
@@ -1,20 +1,28 @@
 from datetime import timedelta
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
 
 from .forms import ReservationForm, ReservationCompleteForm
 from .models import Reservation
-from apps.timeline.models import TimelinePost, Like
 from apps.accounts.services import (
+    apply_daily_activity,
     create_reservation_deposit,
-    create_deposit_return,
-    create_admin_bonus,
-    create_fail_to_team_pool,
-    create_recovery,
+)
+from .services import (
+    CompletionResult,
+    RecoveryResult,
+    aget_dashboard_context,
+    record_completion,
+    recover_reservation,
+    reservation_list_etag,
+    serialize_reservation_list,
+    sweep_missed_reservations,
 )
 
 
@@ -32,25 +40,6 @@ def can_checkin(reservation):
     return (start - timedelta(minutes=10)) <= now <= (start + timedelta(minutes=30))
 
 
-def mark_missed_reservations(user):
-    now = timezone.now()
-    deadline = now - timedelta(minutes=30)
-
-    qs = Reservation.objects.filter(
-        user=user,
-        status="scheduled",
-        completed_at__isnull=True,
-        start_at__lt=deadline,
-    )
-
-    for r in qs:
-        r.status = "missed"
-        r.save(update_fields=["status", "updated_at"])
-
-        if getattr(user, "team", None):
-            create_fail_to_team_pool(user.team, r.id)
-
-
 # =========================
 # 予約作成
 # =========================
@@ -60,12 +49,14 @@ def new_reservation(request):
     if request.method == "POST":
         form = ReservationForm(request.POST, user=request.user)
         if form.is_valid():
-            reservation = form.save(commit=False)
-            reservation.user = request.user
-            reservation.team = getattr(request.user, "team", None)
-            reservation.save()
-
-            create_reservation_deposit(request.user, reservation.id)
+            with transaction.atomic():
+                reservation = form.save(commit=False)
+                reservation.user = request.user
+                reservation.team = getattr(request.user, "team", None)
+                reservation.save()
+
+                apply_daily_activity(request.user.id, timezone.localdate(reservation.start_at), reservations=1)
+                create_reservation_deposit(request.user, reservation.id)
             return redirect("dashboard")
     else:
         form = ReservationForm(user=request.user)
@@ -77,82 +68,12 @@ def new_reservation(request):
 # ダッシュボード
 # =========================
 
+# レプリカからは読まない（遅れたレプリカで組み立てた内容を新しいバージョンのキーでキャッシュしてしまうため）
 @login_required
-def dashboard(request):
-    #期限切れ予約のチェック（ステータス更新）
-    mark_missed_reservations(request.user)
-
-    now = timezone.now()
-    team = getattr(request.user, "team", None)
-
-    last = request.user.last_recovery_at
-    today = timezone.localdate()
-    cooldown_ok = not (last and last > (now - timedelta(days=7)))
-    start_of_week = today - timedelta(days=today.weekday()) 
-    last = request.user.last_recovery_at
-    cooldown_ok = True
-    if last:
-        if last.date() >= start_of_week:
-            cooldown_ok = False
-
-    recovery_available = bool(team) and cooldown_ok
-    reservations = (
-        Reservation.objects.filter(
-            user=request.user,
-            start_at__date__gte=today,
-        )
-        .order_by("start_at")
-    )
-
-    reservation_items = []
-    for r in reservations:
-        local_start = timezone.localtime(r.start_at)
-        is_today = local_start.date() == today
-        is_missed = r.status == "missed"
-        if r.status == "scheduled" and r.start_at + timedelta(minutes=30) < now:
-            is_missed = True
-
-        reservation_items.append({
-            "reservation": r,
-            "is_today": is_today,
-            "completed": (r.status == "completed") or (r.completed_at is not None),
-            "checked_in": r.checkin_at is not None,
-            "can_checkin": can_checkin(r) and (r.checkin_at is None),
-            "missed": is_missed,
-            "recovery": r.status == "recovery",
-            "recovery_available": recovery_available,  
-        })
-
-    team = getattr(request.user, "team", None)
-    timeline_posts = []
-    liked_post_ids = set()
-
-    if team:
-        timeline_posts = (
-            TimelinePost.objects
-            .filter(team=team)
-            .select_related("reservation", "user")
-            .annotate(calculated_count=Count("likes"))
-            .order_by("-created_at")[:20]
-        )
-
-        liked_post_ids = set(
-            Like.objects
-            .filter(user=request.user, post__team=team)
-            .values_list("post_id", flat=True)
-        )
-
-    return render(
-        request,
-        "dashboard.html",
-        {
-            "reservation_items": reservation_items,
-            "timeline_posts": timeline_posts,
-            "team": team,
-            "liked_post_ids": liked_post_ids,
-            "today": today,
-        },
-    )
+async def dashboard(request):
+    # 期限切れ予約のステータス更新は sweep_missed_reservations コマンドが行う（ここでは読むだけ）
+    user = await request.auser()
+    return render(request, "dashboard.html", await aget_dashboard_context(user))
 
 
 # =========================
@@ -202,41 +123,32 @@ def action_reservation(request, reservation_id):
 
 @login_required
 def complete_reservation(request, reservation_id):
-    reservation = get_object_or_404(
-        Reservation,
-        id=reservation_id,
-        user=request.user,
-    )
+    if request.method == "POST":
+        form = ReservationCompleteForm(request.POST)
+        if form.is_valid():
+            try:
+                result = record_completion(
+                    request.user,
+                    reservation_id,
+                    activity_type=form.cleaned_data["activity_type"],
+                    memo=form.cleaned_data["memo"],
+                    share_detail=form.cleaned_data["share_detail"],
+                )
+            except Reservation.DoesNotExist:
+                raise Http404
+            if result.status == CompletionResult.NEED_CHECKIN:
+                return redirect("/?error=need_checkin")
+            return redirect("timeline_list")
+
+    reservation = get_object_or_404(Reservation, id=reservation_id, user=request.user)
 
     if reservation.status == "completed" or reservation.completed_at is not None:
         return redirect("timeline_list")
 
     if reservation.checkin_at is None:
         return redirect("/?error=need_checkin")
-    reservation = get_object_or_404(Reservation, id=reservation_id, user=request.user)
-    
-    if request.method == "POST":
-        form = ReservationCompleteForm(request.POST, instance=reservation)
-        if form.is_valid():
-            r = form.save(commit=False)
-            r.status = "completed"
-            r.completed_at = timezone.now()
-            r.save(update_fields=[
-                "activity_type",
-                "memo",
-                "share_detail",
-                "status",
-                "completed_at",
-                "updated_at",
-            ])
-
-            create_deposit_return(request.user, r.id)
-            create_admin_bonus(request.user, r.id)
-
-            create_timeline_post_if_needed(r)
 
-            return redirect("timeline_list")
-    else:
+    if request.method != "POST":
         form = ReservationCompleteForm(instance=reservation)
 
     return render(request, "reservations/record.html", {
@@ -252,64 +164,33 @@ def complete_reservation(request, reservation_id):
 @require_POST
 @login_required
 def use_recovery(request, reservation_id):
-    reservation = get_object_or_404(
-        Reservation,
-        id=reservation_id,
-        user=request.user,
-    )
+    # スイーパーがまだ回っていない分をここで確定させる
+    sweep_missed_reservations(user=request.user)
 
-    if reservation.status != "missed":
-        return redirect("dashboard")
+    try:
+        result = recover_reservation(request.user, reservation_id)
+    except Reservation.DoesNotExist:
+        raise Http404
 
-    if reservation.used_recovery:
-        return redirect("dashboard")
-
-    user = request.user
-    team = getattr(user, "team", None)
-
-    if team is None:
+    if result == RecoveryResult.NO_TEAM:
         return redirect("/?error=no_team")
-
-    today = timezone.localdate()
-    start_of_week = today - timedelta(days=today.weekday())
-
-    if user.last_recovery_at:
-        if user.last_recovery_at.date() >= start_of_week:
-            return redirect("/?error=recovery_cooldown")
-
-    reservation.status = "recovery"
-    reservation.used_recovery = True
-    reservation.save(update_fields=["status", "used_recovery", "updated_at"])
-
-    create_recovery(user, team, ref_id=reservation.id)
-
-    user.last_recovery_at = timezone.now()
-    user.save(update_fields=["last_recovery_at"])
-
+    if result == RecoveryResult.COOLDOWN:
+        return redirect("/?error=recovery_cooldown")
     return redirect("dashboard")
 
 
 # =========================
-# タイムライン投稿
+# 予約一覧 API（ポーリング用・読み取り専用）
 # =========================
 
-def create_timeline_post_if_needed(reservation):
-    if hasattr(reservation, "timeline_post"):
-        return reservation.timeline_post
-
-    team = getattr(reservation.user, "team", None)
-    if team is None:
-        return None
+def _reservation_list_etag(request):
+    return reservation_list_etag(request.user)
 
-    if reservation.team_id != team.id:
-        reservation.team = team
-        reservation.save(update_fields=["team", "updated_at"])
 
-    visibility = "with_detail" if reservation.share_detail else "summary_only"
-
-    return TimelinePost.objects.create(
-        user=reservation.user,
-        team=team,
-        reservation=reservation,
-        visibility=visibility,
-    )
+@login_required
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_reservation_list_etag)
+def reservation_list_api(request):
+    # If-None-Match が一致すれば condition が 304 を返すので、ここまで来ない
+    return JsonResponse({"reservations": serialize_reservation_list(request.user)})
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "apps.timeline.events.InProcessBroker"
+
+
+def team_channel(team_id):
+    return f"team:{team_id}"
+
+
+class InProcessBroker:
+    """プロセス内だけで配る pub/sub。
+
+    購読者ごとに asyncio.Queue を持ち、publish はどのスレッドからでも呼べる
+    （同期ビューのスレッドから、購読者のイベントループへ call_soon_threadsafe で渡す）。
+    別プロセスのワーカーには届かないので、複数ワーカーで動かすときは
+    TIMELINE_EVENTS_BACKEND を同じインターフェースのブローカー実装に差し替える。
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # ループが閉じている（切断処理中）
+                pass
+
+    @staticmethod
+    def _deliver(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 読めていない購読者の分は捨てる（再接続時にフィードを取り直せばよい）
+            logger.warning("dropping timeline event for a slow subscriber")
+
+    def subscribe(self, channel):
+        """呼び出したイベントループで受け取るキューを登録して返す。"""
+        queue = asyncio.Queue(self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, "TIMELINE_EVENTS_BACKEND", DEFAULT_BACKEND)
+                _broker = import_string(backend)()
+    return _broker
+
+
+@receiver(setting_changed)
+def _reset_broker(setting, **kwargs):
+    global _broker
+    if setting == "TIMELINE_EVENTS_BACKEND":
+        _broker = None
+
+
+def publish_team_event(team_id, event_type, data):
+    """チームの購読者にイベントを送る。トランザクション中ならコミット後に送る。"""
+    if team_id is None:
+        return
+    event = {"type": event_type, "data": data}
+    transaction.on_commit(lambda: get_broker().publish(team_channel(team_id), event))
+
+
+async def team_event_stream(team_id, heartbeat=None):
+    """SSE のレスポンス本体。イベントが来なければ heartbeat 秒ごとにコメント行を送る。
+
+    クライアントが切断するとジェネレーターがキャンセルされ、購読も外れる。
+    """
+    if heartbeat is None:
+        heartbeat = getattr(settings, "TIMELINE_EVENTS_HEARTBEAT", 20)
+    broker = get_broker()
+    channel = team_channel(team_id)
+    queue = broker.subscribe(channel)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(channel, queue)
+
+
+def format_sse(event):
+    payload = json.dumps(event["data"], ensure_ascii=False)
+    return f"event: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.timeline.services import find_like_count_mismatches, repair_like_counts
+
+
+class Command(BaseCommand):
+    help = "Like テーブルから TimelinePost.like_count を数え直す（--check は検証のみ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="直さずに、like_count と実際のいいね数の差分だけを表示する",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = find_like_count_mismatches()
+            for post_id, like_count, actual in mismatches:
+                self.stdout.write(f"post {post_id}: like_count={like_count} actual={actual}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} post(s) out of sync")
+            self.stdout.write(self.style.SUCCESS("all like counts match"))
+            return
+
+        repaired = repair_like_counts()
+        self.stdout.write(self.style.SUCCESS(f"repaired {repaired} post(s)"))
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_count(apps, schema_editor):
+    db = schema_editor.connection.alias
+    TimelinePost = apps.get_model('timeline', 'TimelinePost')
+    Like = apps.get_model('timeline', 'Like')
+    counts = (
+        Like.objects.filter(post=OuterRef('pk'))
+        .values('post')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    TimelinePost.objects.using(db).update(like_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelinepost',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+    ]
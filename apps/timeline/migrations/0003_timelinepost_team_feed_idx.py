@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_ticketbalance'),
+        ('reservations', '0001_initial'),
+        ('timeline', '0002_timelinepost_like_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timelinepost',
+            index=models.Index(fields=['team', '-created_at', '-id'], name='timeline_team_feed_idx'),
+        ),
+    ]
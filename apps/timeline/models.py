@@ -28,9 +28,18 @@ class TimelinePost(models.Model):
 
     visibility = models.CharField(max_length=16, choices=VISIBILITY_CHOICES, default="summary_only")
 
+    # Like の件数（toggle_like が F() で増減する。ズレたら repair_like_counts で直す）
+    like_count = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # チームのフィードを (created_at, id) のカーソルで新しい順に読む
+            models.Index(fields=["team", "-created_at", "-id"], name="timeline_team_feed_idx"),
+        ]
+
 class Like(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
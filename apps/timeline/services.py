@@ -0,0 +1,165 @@
+import asyncio
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .events import publish_team_event
+from .models import TimelinePost, Like
+from apps.accounts.services import aget_team_pool_stats, aget_user_team, get_team_pool_stats
+from apps.common.async_utils import alist
+from apps.common.cursors import keyset_page
+
+
+def _actual_like_count():
+    return Coalesce(
+        Subquery(
+            Like.objects.filter(post=OuterRef("pk"))
+            .values("post")
+            .annotate(c=Count("id"))
+            .values("c")
+        ),
+        0,
+    )
+
+
+@transaction.atomic
+def toggle_post_like(user, post):
+    """いいねを付け外しして、(liked, 最新のいいね数) を返す。
+
+    数が変わったらコミット後にチームの購読者へ like イベントを送る。
+    """
+    delta = 0
+    deleted, _ = Like.objects.filter(user=user, post=post).delete()
+    if deleted:
+        delta = -deleted
+        liked = False
+    else:
+        _, created = Like.objects.get_or_create(user=user, post=post)
+        if created:
+            delta = 1
+        liked = True
+
+    if delta:
+        TimelinePost.objects.filter(pk=post.pk).update(like_count=F("like_count") + delta)
+
+    count = TimelinePost.objects.filter(pk=post.pk).values_list("like_count", flat=True).get()
+    if delta:
+        publish_team_event(post.team_id, "like", {"post_id": post.pk, "like_count": count, "delta": delta})
+    return liked, count
+
+
+def serialize_post(post, liked_ids=()):
+    reservation = post.reservation
+    with_detail = post.visibility == "with_detail"
+    return {
+        "id": post.id,
+        "user": {
+            "id": post.user_id,
+            "display_name": post.user.display_name,
+        },
+        "created_at": post.created_at.isoformat(),
+        "visibility": post.visibility,
+        "activity_type": reservation.activity_type,
+        "activity_label": reservation.get_activity_type_display(),
+        "memo": reservation.memo if with_detail else None,
+        "like_count": post.like_count,
+        "liked": post.id in liked_ids,
+    }
+
+
+# =========================
+# タイムライン画面
+# =========================
+
+TIMELINE_PAGE_SIZE = 20
+
+
+def _timeline_posts(team_id):
+    return (
+        TimelinePost.objects
+        .filter(team_id=team_id)
+        .select_related("user", "reservation")
+        .order_by("-created_at")[:TIMELINE_PAGE_SIZE]
+    )
+
+
+def _liked_post_ids(user, team_id):
+    return Like.objects.filter(user=user, post__team_id=team_id).values_list("post_id", flat=True)
+
+
+def _timeline_context(team, posts=(), liked_ids=(), pool=None):
+    pool = pool or {"balance": 0, "income": 0, "outcome": 0}
+    return {
+        "posts": list(posts),
+        "team": team,
+        "team_pool_balance": pool["balance"],
+        "today_income": pool["income"],
+        "today_outcome": pool["outcome"],
+        "user_liked_post_ids": list(liked_ids),
+    }
+
+
+def build_timeline_context(user):
+    team = user.team
+    if team is None:
+        return _timeline_context(None)
+
+    return _timeline_context(
+        team,
+        posts=_timeline_posts(team.id),
+        liked_ids=_liked_post_ids(user, team.id),
+        pool=get_team_pool_stats(team),
+    )
+
+
+async def abuild_timeline_context(user):
+    """build_timeline_context の async 版。互いに依存しない読み取りは asyncio.gather でまとめて待つ。"""
+    if user.team_id is None:
+        return _timeline_context(None)
+
+    team, posts, liked_ids, pool = await asyncio.gather(
+        aget_user_team(user),
+        alist(_timeline_posts(user.team_id)),
+        alist(_liked_post_ids(user, user.team_id)),
+        aget_team_pool_stats(user.team_id),
+    )
+    return _timeline_context(team, posts=posts, liked_ids=liked_ids, pool=pool)
+
+
+def find_like_count_mismatches():
+    return list(
+        TimelinePost.objects
+        .annotate(actual=_actual_like_count())
+        .exclude(like_count=F("actual"))
+        .values_list("id", "like_count", "actual")
+    )
+
+
+def repair_like_counts():
+    """Like テーブルから like_count を数え直す。直した件数を返す。"""
+    with transaction.atomic():
+        mismatched = [post_id for post_id, _, _ in find_like_count_mismatches()]
+        TimelinePost.objects.filter(id__in=mismatched).update(like_count=_actual_like_count())
+    return len(mismatched)
+
+
+# =========================
+# フィード（カーソルページング）
+# =========================
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+
+
+def get_feed_page(user, team, cursor=None, limit=FEED_PAGE_SIZE):
+    """(created_at, id) の降順で1ページ分返す。OFFSET を使わないので深いページでも一定コスト。"""
+    qs = TimelinePost.objects.filter(team=team).select_related("user", "reservation")
+    posts, next_cursor = keyset_page(qs, cursor, limit)
+
+    liked_ids = set(
+        Like.objects
+        .filter(user=user, post_id__in=[p.id for p in posts])
+        .values_list("post_id", flat=True)
+    )
+    return posts, liked_ids, next_cursor
@@ -1,3 +1,217 @@
-from django.test import TestCase
+import asyncio
+import threading
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .events import InProcessBroker, get_broker, team_channel, team_event_stream
+from .models import TimelinePost, Like
+from apps.accounts.models import Teams, UserProfiles
+from apps.reservations.models import Reservation
+
+
+class TimelineTestMixin:
+    def setUp(self):
+        self.team = Teams.objects.create(name="Team-0001")
+        self.author = UserProfiles.objects.create_user(
+            email="a@example.com", password="pass", display_name="A", team=self.team,
+        )
+        self.fan = UserProfiles.objects.create_user(
+            email="b@example.com", password="pass", display_name="B", team=self.team,
+        )
+        self.post = self._post(self.author)
+
+    def _post(self, user):
+        reservation = Reservation.objects.create(
+            user=user, team=self.team, start_at=timezone.now(),
+            status="completed", completed_at=timezone.now(),
+        )
+        return TimelinePost.objects.create(user=user, team=self.team, reservation=reservation)
+
+
+class LikeCountTests(TimelineTestMixin, TestCase):
+    def test_toggle_like_keeps_counter(self):
+        self.client.force_login(self.fan)
+        url = reverse("timeline_like", args=[self.post.id])
+
+        response = self.client.post(url)
+        self.assertEqual(response.json(), {"liked": True, "count": 1})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        response = self.client.post(url)
+        self.assertEqual(response.json(), {"liked": False, "count": 0})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_cannot_like_own_post(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse("timeline_like", args=[self.post.id]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_repair_command_recounts(self):
+        Like.objects.create(user=self.fan, post=self.post)
+        TimelinePost.objects.filter(pk=self.post.pk).update(like_count=5)
+
+        call_command("repair_like_counts", stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+
+class TimelineFeedTests(TimelineTestMixin, TestCase):
+    def test_pages_through_feed_with_cursor(self):
+        posts = [self.post] + [self._post(self.author) for _ in range(4)]
+        Like.objects.create(user=self.fan, post=posts[3])
+        self.client.force_login(self.fan)
+
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get(reverse("timeline_feed"), params).json()
+            seen += [(p["id"], p["liked"]) for p in data["posts"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        expected = [(p.id, p.id == posts[3].id) for p in reversed(posts)]
+        self.assertEqual(seen, expected)
+
+    def test_rejects_bad_cursor(self):
+        self.client.force_login(self.fan)
+        response = self.client.get(reverse("timeline_feed"), {"cursor": "!!!"})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncTimelineViewTests(TimelineTestMixin, TestCase):
+    def test_async_views_match_sync_versions(self):
+        Like.objects.create(user=self.fan, post=self.post)
+        self.client.force_login(self.fan)
+
+        # 同期版は apps.common.bench_views の URL 設定にだけある
+        sync_urlconf = "apps.common.bench_views"
+        pages = {}
+        for urlconf in ("config.urls", sync_urlconf):
+            with self.settings(ROOT_URLCONF=urlconf):
+                response = self.client.get(reverse("timeline_list"))
+                pages[urlconf] = {
+                    key: response.context[key]
+                    for key in ("posts", "team", "team_pool_balance", "today_income", "today_outcome", "user_liked_post_ids")
+                }
+                me = self.client.get(reverse("me")).json()
+                pages[urlconf]["me"] = me
+
+        self.assertEqual(pages["config.urls"], pages[sync_urlconf])
+        self.assertEqual(pages["config.urls"]["posts"], [self.post])
+        self.assertEqual(pages["config.urls"]["user_liked_post_ids"], [self.post.id])
+
+    async def test_async_toggle_like(self):
+        await self.async_client.aforce_login(self.fan)
+        response = await self.async_client.post(reverse("timeline_like", args=[self.post.id]))
+        self.assertEqual(response.json(), {"liked": True, "count": 1})
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event):
+        self.published.append((channel, event))
+
+
+class InProcessBrokerTests(TestCase):
+    async def test_delivers_to_subscribers_of_the_channel_only(self):
+        broker = InProcessBroker()
+        queue = broker.subscribe("team:1")
+        other = broker.subscribe("team:2")
+        # 同期ビューのスレッドから publish される想定
+        thread = threading.Thread(target=broker.publish, args=("team:1", {"type": "like", "data": {}}))
+        thread.start()
+        thread.join()
+
+        event = await asyncio.wait_for(queue.get(), 1)
+        self.assertEqual(event["type"], "like")
+        self.assertTrue(other.empty())
+
+        broker.unsubscribe("team:1", queue)
+        self.assertEqual(broker.subscriber_count("team:1"), 0)
+        self.assertEqual(broker.subscriber_count("team:2"), 1)
+
+
+@override_settings(TIMELINE_EVENTS_BACKEND="apps.timeline.tests.RecordingBroker")
+class TimelineEventPublishTests(TimelineTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_broker().published.clear()
+
+    def test_like_publishes_count_after_commit(self):
+        self.client.force_login(self.fan)
+        url = reverse("timeline_like", args=[self.post.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+
+        self.assertEqual(
+            [(channel, event["data"]) for channel, event in get_broker().published],
+            [
+                (team_channel(self.team.id), {"post_id": self.post.id, "like_count": 1, "delta": 1}),
+                (team_channel(self.team.id), {"post_id": self.post.id, "like_count": 0, "delta": -1}),
+            ],
+        )
+
+    def test_completion_publishes_new_post(self):
+        from apps.reservations.services import record_completion
+
+        now = timezone.now()
+        reservation = Reservation.objects.create(user=self.fan, start_at=now, checkin_at=now)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = record_completion(self.fan, reservation.id, "run", memo="secret")
+
+        [(channel, event)] = get_broker().published
+        self.assertEqual(event["type"], "post")
+        self.assertEqual(event["data"]["id"], result.post.id)
+        self.assertIsNone(event["data"]["memo"])
+
+
+class TimelineEventStreamTests(TimelineTestMixin, TestCase):
+    async def test_streams_team_events(self):
+        await self.async_client.aforce_login(self.fan)
+        response = await self.async_client.get(reverse("timeline_events"))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+
+        get_broker().publish(team_channel(self.team.id), {"type": "like", "data": {"post_id": 1}})
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(chunk, b'event: like\ndata: {"post_id": 1}\n\n')
+        await stream.aclose()
+
+    async def test_closing_stream_unsubscribes(self):
+        stream = team_event_stream(self.team.id, heartbeat=0.01)
+        self.assertEqual(await anext(stream), "retry: 5000\n\n")
+        self.assertEqual(await anext(stream), ": keep-alive\n\n")
+        self.assertEqual(get_broker().subscriber_count(team_channel(self.team.id)), 1)
+
+        # 切断すると ASGI サーバーがストリームを止める
+        await stream.aclose()
+        self.assertEqual(get_broker().subscriber_count(team_channel(self.team.id)), 0)
+
+    def test_wsgi_request_gets_204(self):
+        # WSGI ではストリームを送れずスレッドを塞ぐだけなので、配信しない
+        self.client.force_login(self.fan)
+        self.assertEqual(self.client.get(reverse("timeline_events")).status_code, 204)
+
+    async def test_user_without_team_gets_204(self):
+        loner = await UserProfiles.objects.acreate(email="c@example.com", display_name="C")
+        await self.async_client.aforce_login(loner)
+        response = await self.async_client.get(reverse("timeline_events"))
+        self.assertEqual(response.status_code, 204)
@@ -2,5 +2,7 @@ from django.urls import path
 from . import views
 urlpatterns = [
     path("", views.timeline_list, name="timeline_list"),
+    path("feed/", views.timeline_feed, name="timeline_feed"),
+    path("events/", views.timeline_events, name="timeline_events"),
     path("<int:post_id>/like/", views.toggle_like, name="timeline_like"),
 ]
@@ -1,83 +1,83 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, get_object_or_404, redirect
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import render, aget_object_or_404
 from django.views.decorators.http import require_POST
-from .models import TimelinePost, Like
-from django.http import JsonResponse
-from django.db.models import Count, Sum, Q
-from django.utils import timezone
-from apps.accounts.models import TicketTransaction  
+from .events import team_event_stream
+from .models import TimelinePost
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .services import (
+    FEED_MAX_PAGE_SIZE,
+    FEED_PAGE_SIZE,
+    abuild_timeline_context,
+    get_feed_page,
+    serialize_post,
+    toggle_post_like,
+)
+from apps.common.cursors import InvalidCursor
+from apps.common.replicas import read_from_replica
 
 @login_required
-def timeline_list(request):
-    team = getattr(request.user, "team", None)
-    today = timezone.localdate()
-    
-    team_pool_balance = 0
-    today_income = 0
-    today_outcome = 0
+@read_from_replica
+async def timeline_list(request):
+    user = await request.auser()
+    return render(request, "timeline/timeline_list.html", await abuild_timeline_context(user))
 
-    if team:
-        # 現在のプール総額
-        pool_data = TicketTransaction.objects.filter(
-            team=team, 
-            owner_type="TEAM"
-        ).aggregate(total=Sum('amount'))
-        team_pool_balance = pool_data['total'] or 0
+@login_required
+@require_POST
+async def toggle_like(request, post_id):
+    user = await request.auser()
+    post = await aget_object_or_404(TimelinePost, id=post_id)
 
-        # 本日の流入
-        income_data = TicketTransaction.objects.filter(
-            team=team,
-            owner_type="TEAM",
-            created_at__date=today,
-            amount__gt=0
-        ).aggregate(total=Sum('amount'))
-        today_income = income_data['total'] or 0
+    if post.user_id == user.id:
+        return JsonResponse({"error": "自分の投稿にはいいねできません"}, status=400)
 
-        # 本日の支出
-        outcome_data = TicketTransaction.objects.filter(
-            team=team,
-            owner_type="TEAM",
-            created_at__date=today,
-            amount__lt=0
-        ).aggregate(total=Sum('amount'))
-        today_outcome = abs(outcome_data['total'] or 0)
+    # transaction.atomic は async に対応していないので、書き込みはスレッドで行う
+    liked, current_count = await sync_to_async(toggle_post_like)(user, post)
 
-        # 投稿一覧
-        posts = TimelinePost.objects.filter(
-            team=team
-        ).select_related('user', 'reservation').annotate(
-            calculated_count=Count('likes')
-        ).order_by('-created_at')[:20]
-    else:
-        posts = []
+    return JsonResponse({"liked": liked, "count": current_count})
 
-    user_liked_post_ids = Like.objects.filter(user=request.user).values_list('post_id', flat=True)
+@login_required
+def timeline_feed(request):
+    team = getattr(request.user, "team", None)
+    if team is None:
+        return JsonResponse({"posts": [], "next_cursor": None})
 
-    return render(request, "timeline/timeline_list.html", {
-        "posts": posts,
-        "team": team,
-        "team_pool_balance": team_pool_balance,
-        "today_income": today_income,
-        "today_outcome": today_outcome,
-        "user_liked_post_ids": list(user_liked_post_ids),
+    try:
+        limit = int(request.GET.get("limit", FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "invalid limit"}, status=400)
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+
+    try:
+        posts, liked_ids, next_cursor = get_feed_page(
+            request.user, team, cursor=request.GET.get("cursor"), limit=limit,
+        )
+    except InvalidCursor:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+
+    return JsonResponse({
+        "posts": [serialize_post(post, liked_ids) for post in posts],
+        "next_cursor": next_cursor,
     })
 
+
 @login_required
-@require_POST
-def toggle_like(request, post_id):
-    post = get_object_or_404(TimelinePost, id=post_id)
-    
-    if post.user_id == request.user.id:
-        return JsonResponse({"error": "自分の投稿にはいいねできません"}, status=400)
+async def timeline_events(request):
+    """チームの新着投稿・いいね数の変化を Server-Sent Events で流す。
 
-    like = Like.objects.filter(user=request.user, post=post).first()
-    if like:
-        like.delete()
-        liked = False
-    else:
-        Like.objects.get_or_create(user=request.user, post=post)
-        liked = True
-    
-    current_count = post.likes.count()
+    async ビューなので、ASGI（config.asgi）で動かせば待機中の接続はスレッドを占有しない。
+    WSGI（runserver など）では終わらない async ジェネレーターを1回も送らずに抱え込み、
+    接続ごとにワーカーのスレッドを塞いでしまうので配信しない。
+    """
+    # 204 を返すと EventSource は再接続しない（ページはリロードで更新する）
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if user.team_id is None:
+        return HttpResponse(status=204)
 
-    return JsonResponse({"liked": liked, "count": current_count})
\ No newline at end of file
+    response = StreamingHttpResponse(team_event_stream(user.team_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,5 +1,9 @@
+import os
 from pathlib import Path
 
+from .caches import cache_from_env
+from .databases import database_from_env, replica_from_env
+
 # config/settings/base.py
 # BASE_DIR は manage.py があるディレクトリを指すのが都合が良い
 BASE_DIR = Path(__file__).resolve()
@@ -26,9 +30,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.common.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "apps.common.replicas.ReplicaStickinessMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -55,12 +61,24 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 ASGI_APPLICATION = "config.asgi.application"
 
+# DB_ENGINE=postgres で PostgreSQL（接続先は POSTGRES_*、コネクションプールつき）。既定は SQLite（config/settings/databases.py）
+# SQLite は開発・テスト・本番とも同じ設定（WAL・busy timeout・BEGIN IMMEDIATE）にして、テスト（ファイルのテスト DB）で
+# 同時書き込みまで本番と同じ条件で確かめられるようにする（prod.py はこれをそのまま使う）。
+# SQLite の接続の持ち回しは WSGI（gunicorn など）で動かすときだけ DB_CONN_MAX_AGE=60 などにする。
+# ASGI ではリクエストごとに同期処理のスレッドが変わり接続を使い回せないので 0 のまま
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_from_env(BASE_DIR / "db.sqlite3", tuned=True),
 }
+# 読み取りレプリカ（DB_REPLICA_NAME / POSTGRES_REPLICA_HOST を設定したときだけ）
+# @read_from_replica を付けたビューの SELECT だけがここを読む（apps.common.replicas）
+if replica := replica_from_env(tuned=True):
+    DATABASES["replica"] = replica
+
+DATABASE_ROUTERS = ["apps.common.replicas.ReplicaRouter"]
+REPLICA_DATABASE = "replica"
+# 書き込みのあと、この秒数はそのクライアントの読み取りを primary に固定する（レプリカの遅れを見せない）
+REPLICA_STICKY_SECONDS = 5
+REPLICA_PIN_COOKIE = "primary_until"
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -83,6 +101,55 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "accounts.UserProfiles"
 
+# CACHE_BACKEND=locmem（既定。prod は file）/ file / redis（config/settings/caches.py）
+# アプリからは apps.common.cache.CacheNamespace を通して使う（namespace ごとにヒット・ミスを数える）
+CACHES = {
+    "default": cache_from_env(BASE_DIR / ".cache"),
+}
+
+# ログイン中のユーザーはチームと一緒にキャッシュから読む（apps.accounts.backends）
+AUTHENTICATION_BACKENDS = ["apps.accounts.backends.CachedModelBackend"]
+# キャッシュしたユーザーの寿命（秒）。save / delete を通らない更新（QuerySet.update() など）はこの秒数で反映される
+AUTH_USER_CACHE_TTL = 60  # 0 でキャッシュしない
+
+# セッションの保存先（SESSION_BACKEND=db / cached_db / cache / file）
+# cache はキャッシュにしか置かないので、キャッシュが消えるとログアウトされる（プロセス内キャッシュならワーカーごとに別）
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "file": "django.contrib.sessions.backends.file",
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get("SESSION_BACKEND", "db")]
+
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/auth/login/"
+
+# リクエスト計測（apps.common.middleware.RequestMetricsMiddleware）
+# 計測するリクエストの割合（0.0〜1.0）と、同じ形のクエリが何回以上で N+1 として警告するか
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# タイムラインのリアルタイム配信（apps.timeline.events）
+# 既定はプロセス内 pub/sub。複数ワーカーで動かすときは同じインターフェースのブローカー実装に差し替える
+TIMELINE_EVENTS_BACKEND = "apps.timeline.events.InProcessBroker"
+# イベントがないときに keep-alive を送る間隔（秒）
+TIMELINE_EVENTS_HEARTBEAT = 20
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # 1リクエスト1行の計測ログは INFO、N+1 の疑いは WARNING。既定は WARNING だけ出す（開発・テストの出力を埋めない）。
+        # 全リクエストの行を見るときは REQUEST_METRICS_LOG_LEVEL=INFO（prod は INFO）
+        "apps.request_metrics": {
+            "handlers": ["console"],
+            "level": os.environ.get("REQUEST_METRICS_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+    },
+}
@@ -0,0 +1,59 @@
+# config/settings/caches.py
+# CACHES の default エントリを作るヘルパー（base.py が使う）
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+# どのバックエンドでもキーの頭に付ける（同じ Redis を別のアプリと共有しても混ざらない）
+CACHE_KEY_PREFIX = "team9"
+# プロセス内キャッシュに置ける件数。超えると 1/3 を追い出す（apps.common.cache.CountingLocMemCache が数える）
+LOCMEM_MAX_ENTRIES = 10000
+LOCMEM_BACKEND = "apps.common.cache.CountingLocMemCache"
+# ユーザーをキャッシュから読む認証バックエンド（apps.accounts.backends）
+CACHED_AUTH_BACKEND = "apps.accounts.backends.CachedModelBackend"
+
+
+def cache_from_env(file_location, default="locmem"):
+    """CACHE_BACKEND（locmem / file / redis。未設定なら default）に応じた CACHES のエントリ。
+
+    - locmem: プロセス内。ワーカーごとに別なので、複数ワーカーでは無効化が他のワーカーに届かない
+    - file: CACHE_LOCATION（既定は file_location）のディレクトリ。同じマシンのワーカー間で共有できる
+    - redis: REDIS_URL の Redis（redis パッケージが必要）
+    """
+    backend = os.environ.get("CACHE_BACKEND", default)
+    if backend == "locmem":
+        cache = {
+            "BACKEND": LOCMEM_BACKEND,
+            "LOCATION": "team9",
+            "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", LOCMEM_MAX_ENTRIES))},
+        }
+    elif backend == "file":
+        cache = {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", str(file_location)),
+        }
+    elif backend == "redis":
+        cache = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0"),
+        }
+    else:
+        raise ImproperlyConfigured(f"CACHE_BACKEND must be 'locmem', 'file' or 'redis', not {backend!r}")
+    cache["KEY_PREFIX"] = CACHE_KEY_PREFIX
+    return cache
+
+
+def require_shared_cache(cache, authentication_backends, auth_user_cache_ttl):
+    """CachedModelBackend がプロセス内キャッシュを使う設定なら ImproperlyConfigured（prod.py が呼ぶ）。
+
+    プロセス内キャッシュではユーザーの save / delete で捨てたキャッシュが他のワーカーに残り、
+    権限を外したユーザーや退会したユーザーが AUTH_USER_CACHE_TTL 秒の間そのまま通ってしまう。
+    """
+    if CACHED_AUTH_BACKEND not in authentication_backends or not auth_user_cache_ttl:
+        return
+    if cache["BACKEND"] == LOCMEM_BACKEND:
+        raise ImproperlyConfigured(
+            f"{CACHED_AUTH_BACKEND} needs a cache shared between workers: "
+            "set CACHE_BACKEND to 'file' or 'redis', or AUTH_USER_CACHE_TTL to 0"
+        )
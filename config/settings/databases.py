@@ -0,0 +1,104 @@
+# config/settings/databases.py
+# DATABASES の1エントリを作るヘルパー（base.py と bench_write_contention が使う）
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+# 本番の SQLite で接続ごとに流す PRAGMA
+# - WAL: 読み取りが書き込みを待たない
+# - synchronous=NORMAL: WAL ならコミットごとの fsync を省いても壊れない（電源断で直近のコミットが消えうるだけ）
+# - mmap_size / cache_size: 読み取りをページキャッシュとメモリマップで返す（cache_size は負数で KiB 指定）
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+}
+
+# ロック待ちの上限（秒）。Python の sqlite3 はこの間ビジーハンドラーでリトライする
+SQLITE_BUSY_TIMEOUT = 20
+
+
+def sqlite_database(name, tuned=False, conn_max_age=0):
+    """SQLite の DATABASES エントリ。
+
+    tuned=True で本番向けの設定にする。書き込みトランザクションを BEGIN IMMEDIATE で始めるので、
+    読んでから書く処理（台帳の既存チェック → INSERT など）がロックの格上げでぶつからず、
+    busy timeout の範囲で順番待ちになる（DEFERRED だと格上げ時の衝突は待たずに "database is locked"）。
+    """
+    database = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+    }
+    if tuned:
+        database.update({
+            "CONN_MAX_AGE": conn_max_age,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "timeout": SQLITE_BUSY_TIMEOUT,
+                "init_command": ";".join(f"PRAGMA {key}={value}" for key, value in SQLITE_PRAGMAS.items()),
+            },
+        })
+    return database
+
+
+def postgres_database():
+    """PostgreSQL の DATABASES エントリ。接続先は POSTGRES_* 環境変数で渡す。
+
+    Django 組み込みのコネクションプール（psycopg[pool]）を使う。プールと CONN_MAX_AGE は併用できないので
+    CONN_MAX_AGE は 0 のまま。ASGI でリクエストごとにスレッドが変わっても接続はプールから借りられる。
+    """
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("POSTGRES_DB", "team9"),
+        "USER": os.environ.get("POSTGRES_USER", "postgres"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+                # プールが空いたときに待つ秒数
+                "timeout": 10,
+            },
+        },
+    }
+
+
+def replica_from_env(tuned=False):
+    """読み取りレプリカの DATABASES エントリ。設定されていなければ None。
+
+    SQLite は DB_REPLICA_NAME（レプリカのファイル）、PostgreSQL は POSTGRES_REPLICA_HOST で指定する。
+    テストではレプリカも default と同じテスト DB を読む（TEST.MIRROR）。
+    """
+    engine = os.environ.get("DB_ENGINE", "sqlite")
+    if engine == "postgres" and os.environ.get("POSTGRES_REPLICA_HOST"):
+        database = postgres_database()
+        database["HOST"] = os.environ["POSTGRES_REPLICA_HOST"]
+        database["PORT"] = os.environ.get("POSTGRES_REPLICA_PORT", database["PORT"])
+    elif engine == "sqlite" and os.environ.get("DB_REPLICA_NAME"):
+        database = sqlite_database(os.environ["DB_REPLICA_NAME"], tuned=tuned)
+    else:
+        return None
+    database["TEST"] = {"MIRROR": "default"}
+    return database
+
+
+def database_from_env(sqlite_name, tuned=False):
+    """DB_ENGINE（sqlite / postgres、既定は sqlite）で default の DB を選ぶ。
+
+    SQLite のテスト DB はインメモリではなく、隣のファイル（test_<name>）に作る。インメモリだと
+    busy timeout のないテーブルロックになり、同時書き込みのテストが動かせないため。
+    """
+    engine = os.environ.get("DB_ENGINE", "sqlite")
+    if engine == "postgres":
+        return postgres_database()
+    if engine == "sqlite":
+        database = sqlite_database(sqlite_name, tuned=tuned, conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", "0")))
+        database["TEST"] = {"NAME": str(Path(sqlite_name).with_name(f"test_{Path(sqlite_name).name}"))}
+        return database
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgres', not {engine!r}")
@@ -1,3 +1,20 @@
+import os
+
 from .base import *  # noqa
+from .caches import cache_from_env, require_shared_cache
 
 DEBUG = False
+
+# 本番は複数ワーカーで動かすので、キャッシュは既定でワーカー間で共有できる file にする（CACHE_BACKEND=redis も可）。
+# ログイン中のユーザーをキャッシュから読むので、locmem を選ぶと起動時にエラーにする
+CACHES = {
+    "default": cache_from_env(BASE_DIR / ".cache", default="file"),
+}
+require_shared_cache(CACHES["default"], AUTHENTICATION_BACKENDS, AUTH_USER_CACHE_TTL)
+
+# 本番は一部のリクエストだけ計測して、その全部をログに出す
+REQUEST_METRICS_SAMPLE_RATE = 0.05
+LOGGING["loggers"]["apps.request_metrics"]["level"] = os.environ.get("REQUEST_METRICS_LOG_LEVEL", "INFO")
+
+# セッションは DB に書きつつキャッシュから読む（SESSION_BACKEND で変えられる）
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get("SESSION_BACKEND", "cached_db")]
@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from apps.common.api.health import healthz
+from apps.common.api.health import cache_metrics, healthz
 from apps.reservations import views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("healthz/", healthz),
+    path("healthz/cache/", cache_metrics, name="cache_metrics"),
 
     path("", views.dashboard, name="dashboard"),
     path("auth/", include("apps.accounts.urls")),
@@ -0,0 +1,72 @@
+// タイムラインの新着投稿・いいね数をサーバーから受け取って反映する（Server-Sent Events）
+document.addEventListener('DOMContentLoaded', () => {
+    const list = document.querySelector('.reservation-list[data-events-url]');
+    if (!list || !window.EventSource) return;
+
+    const source = new EventSource(list.dataset.eventsUrl);
+
+    source.addEventListener('like', (e) => {
+        const data = JSON.parse(e.data);
+        const card = list.querySelector(`[data-post-id="${data.post_id}"]`);
+        if (!card) return;
+        card.querySelector('.like-count').textContent = data.like_count;
+    });
+
+    source.addEventListener('post', (e) => {
+        const post = JSON.parse(e.data);
+        if (list.querySelector(`[data-post-id="${post.id}"]`)) return;
+
+        const empty = list.querySelector('.empty-msg');
+        if (empty) empty.remove();
+        list.prepend(buildCard(post));
+    });
+});
+
+// _post.html と同じ構造のカードを作る
+function buildCard(post) {
+    const el = (tag, className, text) => {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    };
+    const createdAt = new Date(post.created_at);
+    const pad = (n) => String(n).padStart(2, '0');
+
+    const card = el('div', 'reservation-card timeline-card');
+    card.dataset.postId = post.id;
+
+    const main = el('div', 'timeline-main');
+    const userInfo = el('div', 'user-info');
+    userInfo.append(el('div', 'user-avatar', post.user.display_name.slice(0, 1)));
+    const meta = el('div', 'user-meta');
+    meta.append(
+        el('span', 'user-name', post.user.display_name),
+        el('span', 'res-date', `${createdAt.getMonth() + 1}/${createdAt.getDate()} ${pad(createdAt.getHours())}:${pad(createdAt.getMinutes())}`),
+    );
+    userInfo.append(meta);
+
+    const content = el('div', 'activity-content');
+    const header = el('div', 'activity-header');
+    header.append(el('span', 'res-label', 'ACTIVITY'), el('div', 'activity-type', post.activity_label));
+    content.append(header);
+    if (post.visibility === 'with_detail') {
+        if (post.memo) content.append(el('div', 'activity-memo', post.memo));
+    } else {
+        content.append(el('p', 'status-info small', '詳細なし'));
+    }
+    main.append(userInfo, content);
+
+    const footer = el('div', 'timeline-footer');
+    footer.append(el('div', 'status-badge-complete', '達成 🎉'));
+    const likeContainer = el('div', 'like-container');
+    const btn = el('button', 'like-btn');
+    btn.type = 'button';
+    btn.dataset.url = `/timeline/${post.id}/like/`;
+    btn.append(el('span', 'heart', '🤍'), el('span', 'like-count', post.like_count));
+    likeContainer.append(btn);
+    footer.append(likeContainer);
+
+    card.append(main, footer);
+    return card;
+}